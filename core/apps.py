@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core import checks  # noqa: F401
+        from core.utils.jobs import queue_metrics
+        from core.utils.metrics import register_collector
+        from core.utils.response_cache import response_cache_metrics
+
+        register_collector(queue_metrics)
+        register_collector(response_cache_metrics)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+# Caches whose writes must be seen by every web and worker process.
+SHARED_CACHE_SETTINGS = ('VERSION_CACHE_ALIAS', 'USER_SNAPSHOT_CACHE_ALIAS', 'FRIEND_CACHE_ALIAS')
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    """
+    Warn when a cache that has to be shared by all processes is local to
+    each one. Outside development, version bumps, token revocation and
+    friend list invalidations would then only reach the process making
+    them.
+    """
+    if settings.DEBUG:
+        return []
+    warnings = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name)
+        backend = settings.CACHES[alias]['BACKEND']
+        if backend in PROCESS_LOCAL_BACKENDS:
+            warnings.append(Warning(
+                f"{name} uses the '{alias}' cache, which is local to each process.",
+                hint="Set REDIS_URL, or point the alias at another shared cache, "
+                     "when running more than one process.",
+                id='core.W001',
+            ))
+    return warnings
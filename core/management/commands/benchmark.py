@@ -0,0 +1,279 @@
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.management.commands.seed_graph import SEED_EMAIL_DOMAIN, SEED_PASSWORD
+from friends.models import FriendRequest, Friendship
+from friends.v1.urls import urlpatterns as friends_urlpatterns
+from users.authentication import tokens_for_user
+from users.models import User
+from users.v1.urls import urlpatterns as users_urlpatterns
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run by each thread."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def reset(self):
+        self.local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self.local, 'count', 0)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.local.count = self.count + 1
+        return execute(sql, params, many, context)
+
+
+class FakeUserinfoHandler(BaseHTTPRequestHandler):
+    """Answers Google userinfo calls so google-auth can be driven offline."""
+
+    def do_GET(self):
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        body = json.dumps({'email': f'{token}@google.{SEED_EMAIL_DOMAIN}', 'name': 'Google User'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ("Drive every users/friends API route through the WSGI app and report "
+            "throughput, latency percentiles and queries per request. Run it "
+            "against a database seeded with seed_graph: write routes modify data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads.')
+        parser.add_argument('--users', type=int, default=100, help='Number of seeded users acting as clients.')
+        parser.add_argument('--routes', nargs='*', help='Only run these route names.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='JSON report of an earlier run to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown before a route counts as a regression.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for request payloads.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.app = WSGIHandler()
+        self.factory = RequestFactory()
+        self.counter = QueryCounter()
+        self.clients = self.prepare_clients(options['users'])
+        self.user_ids = [client['id'] for client in self.clients]
+
+        scenarios = self.get_scenarios()
+        route_names = [pattern.name for pattern in users_urlpatterns + friends_urlpatterns]
+        missing = [name for name in route_names if not any(name == scenario[0] for scenario in scenarios)]
+        if missing:
+            self.stderr.write(f"No benchmark scenario for routes: {', '.join(missing)}")
+        if options['routes']:
+            scenarios = [scenario for scenario in scenarios if scenario[0] in options['routes']]
+
+        google = ThreadingHTTPServer(('127.0.0.1', 0), FakeUserinfoHandler)
+        threading.Thread(target=google.serve_forever, daemon=True).start()
+        try:
+            with override_settings(GOOGLE_USERINFO_URL=f'http://127.0.0.1:{google.server_port}/'):
+                results = {}
+                for name, method, variant, build in scenarios:
+                    label = f"{name} {method}" + (f" [{variant}]" if variant else '')
+                    self.stdout.write(f"Running {label} ...")
+                    results[label] = self.run_scenario(method, build, options['requests'], options['concurrency'])
+        finally:
+            google.shutdown()
+            google.server_close()
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'users': User.objects.count(),
+                'friendships': Friendship.objects.count() // 2,
+                'requests_per_route': options['requests'],
+                'concurrency': options['concurrency'],
+            },
+            'routes': results,
+        }
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = self.compare(json.load(baseline)['routes'], results, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def prepare_clients(self, count):
+        users = list(User.objects.filter(email__endswith=SEED_EMAIL_DOMAIN).order_by('?')[:count])
+        if not users:
+            raise CommandError("No seeded users found, run seed_graph first.")
+        pending = {}
+        for request_id, receiver_id in FriendRequest.objects.filter(
+                receiver__in=users, status='pending').values_list('id', 'receiver_id'):
+            pending.setdefault(receiver_id, []).append(request_id)
+        return [{
+            'id': user.id,
+            'email': user.email,
+            'token': str(tokens_for_user(user).access_token),
+            'pending': pending.get(user.id, []),
+        } for user in users]
+
+    def get_scenarios(self):
+        """
+        (route name, method, variant, build) tuples, where build(client)
+        returns the (path, payload) of one request.
+        """
+        unique = itertools.count()
+
+        def pop_pending(client):
+            return client['pending'].pop() if client['pending'] else 0
+
+        return [
+            ('register', 'POST', '', lambda client: (reverse('register'), {
+                'name': 'Bench Register', 'email': f'register-{uuid.uuid4().hex}@{SEED_EMAIL_DOMAIN}',
+                'password': SEED_PASSWORD, 'confirm_password': SEED_PASSWORD})),
+            ('login', 'POST', '', lambda client: (reverse('login'), {
+                'email': client['email'], 'password': SEED_PASSWORD})),
+            ('google-auth', 'POST', '', lambda client: (reverse('google-auth'), {
+                'access_token': f'bench-{next(unique)}'})),
+            ('profile', 'GET', '', lambda client: (reverse('profile'), None)),
+            ('profile', 'PATCH', '', lambda client: (reverse('profile'), {'bio': 'benchmark'})),
+            ('user-list', 'GET', '', lambda client: (reverse('user-list'), None)),
+            ('user-list', 'GET', 'search', lambda client: (reverse('user-list') + '?search=Bench User 1', None)),
+            ('friend-suggestions', 'GET', '', lambda client: (reverse('friend-suggestions'), None)),
+            ('send-friend-request', 'POST', '', lambda client: (reverse('send-friend-request'), {
+                'receiver': self.rng.choice(self.user_ids)})),
+            ('bulk-send-friend-requests', 'POST', '', lambda client: (reverse('bulk-send-friend-requests'), {
+                'receivers': self.rng.sample(self.user_ids, min(20, len(self.user_ids)))})),
+            ('received-requests', 'GET', '', lambda client: (reverse('received-requests'), None)),
+            ('manage-request', 'PATCH', '', lambda client: (
+                reverse('manage-request', kwargs={'pk': pop_pending(client)}), {'status': 'accepted'})),
+            ('bulk-manage-requests', 'PATCH', '', lambda client: (reverse('bulk-manage-requests'), {
+                'senders': self.rng.sample(self.user_ids, min(20, len(self.user_ids))), 'status': 'rejected'})),
+            ('list-friends', 'GET', '', lambda client: (reverse('list-friends'), None)),
+            ('stream-friends', 'GET', '', lambda client: (reverse('stream-friends'), None)),
+            ('mutual-friends', 'GET', '', lambda client: (
+                reverse('mutual-friends', kwargs={'user_id': self.rng.choice(self.user_ids)}), None)),
+            ('mutual-friend-counts', 'GET', '', lambda client: (reverse('mutual-friend-counts') + '?users=' + ','.join(
+                map(str, self.rng.sample(self.user_ids, min(20, len(self.user_ids))))), None)),
+            ('friend-path', 'GET', '', lambda client: (
+                reverse('friend-path', kwargs={'user_id': self.rng.choice(self.user_ids)}), None)),
+            ('friendship-changes', 'GET', '', lambda client: (reverse('friendship-changes') + '?since=0', None)),
+        ]
+
+    def call(self, method, path, payload, client):
+        extra = {'HTTP_AUTHORIZATION': f"Bearer {client['token']}"}
+        if payload is None:
+            request = self.factory.generic(method, path, **extra)
+        else:
+            request = self.factory.generic(method, path, json.dumps(payload),
+                                           content_type='application/json', **extra)
+        status = {}
+
+        def start_response(status_line, headers, exc_info=None):
+            status['code'] = int(status_line.split(' ', 1)[0])
+
+        with connection.execute_wrapper(self.counter):
+            self.counter.reset()
+            started = time.perf_counter()
+            result = self.app(request.environ, start_response)
+            try:
+                b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            elapsed = time.perf_counter() - started
+            queries = self.counter.count
+        return status['code'], elapsed, queries
+
+    def run_scenario(self, method, build, total, concurrency):
+        jobs = [(self.clients[index % len(self.clients)]) for index in range(total)]
+        jobs = [(client,) + build(client) for client in jobs]
+
+        def run(job):
+            client, path, payload = job
+            try:
+                return self.call(method, path, payload, client)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(run, jobs))
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for _, elapsed, _ in samples)
+        statuses = Counter(str(code) for code, _, _ in samples)
+        return {
+            'requests': total,
+            'errors': sum(count for code, count in statuses.items() if int(code) >= 500),
+            'status_codes': dict(statuses),
+            'throughput_rps': round(total / wall, 2),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+            },
+            'queries_per_request': round(sum(queries for _, _, queries in samples) / total, 2),
+        }
+
+    def print_report(self, results):
+        header = f"{'route':<36} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'5xx':>5}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for label, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{label:<36} {result['throughput_rps']:>9} {latency['p50']:>9} {latency['p95']:>9} "
+                f"{latency['p99']:>9} {result['queries_per_request']:>8} {result['errors']:>5}")
+
+    def compare(self, baseline, results, tolerance):
+        regressions = []
+        for label, result in results.items():
+            previous = baseline.get(label)
+            if previous is None:
+                continue
+            if result['latency_ms']['p95'] > previous['latency_ms']['p95'] * (1 + tolerance):
+                regressions.append(f"{label}: p95 {previous['latency_ms']['p95']} -> {result['latency_ms']['p95']} ms")
+            if result['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{label}: throughput {previous['throughput_rps']} -> {result['throughput_rps']} rps")
+            if result['queries_per_request'] > previous['queries_per_request'] + 0.5:
+                regressions.append(
+                    f"{label}: queries {previous['queries_per_request']} -> {result['queries_per_request']}")
+            if result['errors'] > previous['errors']:
+                regressions.append(f"{label}: 5xx {previous['errors']} -> {result['errors']}")
+        return regressions
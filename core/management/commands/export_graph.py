@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.utils.bulk_io import FORMATS, RecordWriter, guess_format, open_stream
+from friends.models import FriendRequest
+from users.models import User
+
+
+USERS = 'users'
+FRIEND_REQUESTS = 'friend-requests'
+
+USER_FIELDS = ['email', 'name', 'bio', 'location', 'birth_date', 'profile_picture', 'is_active', 'password_hash']
+FRIEND_REQUEST_FIELDS = ['sender', 'receiver', 'status']
+
+
+class Command(BaseCommand):
+    help = ("Stream users or friend requests to NDJSON or CSV in bounded memory. "
+            "Friend requests reference users by email, so the files can be "
+            "loaded into another environment with import_graph.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=[USERS, FRIEND_REQUESTS])
+        parser.add_argument('path', help="Output file, '-' for stdout.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension, else ndjson.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows fetched per round trip.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if options['kind'] == USERS:
+            fields = USER_FIELDS
+            rows = User.objects.order_by('id').values_list(
+                'email', 'name', 'bio', 'location', 'birth_date', 'profile_picture', 'is_active', 'password')
+        else:
+            fields = FRIEND_REQUEST_FIELDS
+            rows = FriendRequest.objects.order_by('id').values_list('sender__email', 'receiver__email', 'status')
+
+        stream, close = open_stream(options['path'], 'w')
+        # Progress would interleave with the records on stdout.
+        progress = close and options['verbosity'] > 0
+        started = time.monotonic()
+        exported = 0
+        try:
+            writer = RecordWriter(stream, fmt, fields)
+            # Server-side cursor on PostgreSQL, chunked fetches elsewhere.
+            for row in rows.iterator(chunk_size=options['batch_size']):
+                writer.write(row)
+                exported += 1
+                if progress and exported % options['batch_size'] == 0:
+                    self.stdout.write(f"{exported} rows ({exported / (time.monotonic() - started):.0f}/s)")
+        finally:
+            if close:
+                stream.close()
+
+        if close:
+            self.stdout.write(self.style.SUCCESS(f"Exported {exported} {options['kind']} to {options['path']}."))
@@ -0,0 +1,175 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.management.commands.export_graph import FRIEND_REQUESTS, USERS
+from core.utils.bulk_io import (
+    FORMATS, chunked, guess_format, hash_passwords, init_hash_worker, insert_objects, open_stream, read_records,
+)
+from core.utils.conditional import bump_versions, version_key
+from friends.models import FriendRequest, Friendship, FriendshipEvent
+from friends.utils.counters import reconcile_counters
+from friends.utils.friend_requests import invalidate_friendship
+from users.models import User
+
+
+STATUSES = {status for status, _ in FriendRequest.STATUS_CHOICES}
+
+
+class Command(BaseCommand):
+    help = ("Stream users or friend requests from NDJSON or CSV into the database "
+            "in bounded memory. Rows are inserted in chunks; users or edges that "
+            "already exist are skipped, invalid rows are reported and skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=[USERS, FRIEND_REQUESTS])
+        parser.add_argument('path', help="Input file, '-' for stdin.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension, else ndjson.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per transaction.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing plain text passwords, 1 hashes inline.')
+        parser.add_argument('--copy', action='store_true',
+                            help='Load with PostgreSQL COPY instead of INSERT.')
+        parser.add_argument('--max-errors', type=int, default=100,
+                            help='Invalid rows reported individually before staying quiet.')
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError("--copy requires PostgreSQL.")
+        self.use_copy = options['copy']
+        self.max_errors = options['max_errors']
+        self.rejected = 0
+        fmt = options['format'] or guess_format(options['path'])
+
+        executor = None
+        if options['kind'] == USERS and options['workers'] > 1:
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=init_hash_worker)
+
+        stream, close = open_stream(options['path'], 'r')
+        started = time.monotonic()
+        read = inserted = 0
+        try:
+            for chunk in chunked(read_records(stream, fmt), options['batch_size']):
+                if options['kind'] == USERS:
+                    inserted += self.import_users(chunk, executor)
+                else:
+                    inserted += self.import_friend_requests(chunk)
+                read += len(chunk)
+                if options['verbosity'] > 0:
+                    self.stdout.write(f"{read} rows read, {inserted} inserted, {self.rejected} rejected "
+                                      f"({read / (time.monotonic() - started):.0f} rows/s)")
+        finally:
+            if close:
+                stream.close()
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {inserted} of {read} {options['kind']} rows, {self.rejected} rejected, "
+            f"in {time.monotonic() - started:.1f}s."))
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if self.rejected <= self.max_errors:
+            self.stderr.write(f"Line {line}: {reason}")
+
+    def import_users(self, chunk, executor):
+        users = {}
+        for line, record in chunk:
+            email = User.objects.normalize_email((record.get('email') or '').strip())
+            if not email or not record.get('name'):
+                self.reject(line, "email and name are required.")
+                continue
+            user = User(email=email, name=record['name'], bio=record.get('bio'), location=record.get('location'),
+                        profile_picture=record.get('profile_picture'))
+            try:
+                user.birth_date = User._meta.get_field('birth_date').to_python(record.get('birth_date'))
+                if record.get('is_active') is not None:
+                    user.is_active = User._meta.get_field('is_active').to_python(record['is_active'])
+            except ValidationError as error:
+                self.reject(line, ' '.join(error.messages))
+                continue
+            # Exported hashes are kept, plain text passwords are hashed below.
+            user.password = record.get('password_hash') or record.get('password')
+            user._hashed = bool(record.get('password_hash'))
+            users[email] = user
+
+        # Skipping existing users up front also skips hashing their passwords.
+        existing = set(User.objects.filter(email__in=users).values_list('email', flat=True))
+        users = [user for email, user in users.items() if email not in existing]
+        plain = [user for user in users if not user._hashed]
+        for user, password in zip(plain, hash_passwords(executor, [user.password for user in plain])):
+            user.password = password
+
+        with transaction.atomic():
+            inserted = insert_objects(User, users, self.use_copy)
+        # bulk inserts skip the post_save handlers bumping the list version.
+        bump_versions(version_key('users'))
+        return len(users) if inserted is None else inserted
+
+    def import_friend_requests(self, chunk):
+        emails = set()
+        for _, record in chunk:
+            emails.add(User.objects.normalize_email(record.get('sender') or ''))
+            emails.add(User.objects.normalize_email(record.get('receiver') or ''))
+        user_ids = dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+
+        requests, pairs = [], set()
+        for line, record in chunk:
+            sender_id = user_ids.get(User.objects.normalize_email(record.get('sender') or ''))
+            receiver_id = user_ids.get(User.objects.normalize_email(record.get('receiver') or ''))
+            status = record.get('status') or 'pending'
+            if sender_id is None or receiver_id is None:
+                self.reject(line, f"unknown user {record.get('sender') if sender_id is None else record.get('receiver')}.")
+                continue
+            if sender_id == receiver_id:
+                self.reject(line, "sender and receiver are the same user.")
+                continue
+            if status not in STATUSES:
+                self.reject(line, f"invalid status {status}.")
+                continue
+            if (receiver_id, sender_id) in pairs:
+                self.reject(line, "a request already exists in the other direction.")
+                continue
+            pairs.add((sender_id, receiver_id))
+            requests.append((line, FriendRequest(sender_id=sender_id, receiver_id=receiver_id, status=status)))
+
+        # A request in the other direction would leave the pair with two
+        # conflicting statuses, the API accepts it instead of sending one.
+        existing = set()
+        if pairs:
+            existing = {(receiver_id, sender_id) for sender_id, receiver_id in FriendRequest.objects.filter(
+                sender_id__in={receiver_id for _, receiver_id in pairs},
+                receiver_id__in={sender_id for sender_id, _ in pairs},
+            ).values_list('sender_id', 'receiver_id')} & pairs
+        for line, friend_request in requests:
+            if (friend_request.sender_id, friend_request.receiver_id) in existing:
+                self.reject(line, "a request already exists in the other direction.")
+        requests = [friend_request for _, friend_request in requests
+                    if (friend_request.sender_id, friend_request.receiver_id) not in existing]
+
+        with transaction.atomic():
+            # Only the rows inserted here are linked and recorded, a pair
+            # skipped on a conflict keeps the status it already had.
+            inserted = insert_objects(FriendRequest, requests, self.use_copy,
+                                      returning=['id', 'sender', 'receiver', 'status'])
+            friendships, events, affected = [], [], set()
+            for request_id, sender_id, receiver_id, status in inserted:
+                affected.update((sender_id, receiver_id))
+                if status == 'accepted':
+                    friendships.append(Friendship(user_id=sender_id, friend_id=receiver_id))
+                    friendships.append(Friendship(user_id=receiver_id, friend_id=sender_id))
+                if status == 'pending':
+                    events.append(('sent', sender_id, receiver_id, request_id))
+                else:
+                    events.append((status, receiver_id, sender_id, request_id))
+            insert_objects(Friendship, friendships, self.use_copy)
+            FriendshipEvent.objects.record_many(events)
+            # Bulk inserts bypass CounterDeltas.
+            reconcile_counters(affected)
+        invalidate_friendship(*affected)
+        return len(inserted)
@@ -0,0 +1,83 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.utils.job_processes import init_process_worker
+from core.utils.jobs import autodiscover_jobs, claim_jobs, finish_job, run_job
+
+
+class Command(BaseCommand):
+    help = ("Run the background jobs queued in the database with a pool of "
+            "threads or processes, until interrupted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS,
+                            help='Jobs run concurrently.')
+        parser.add_argument('--processes', action='store_true',
+                            help='Run jobs in worker processes instead of threads, for CPU bound jobs.')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to wait before looking for jobs again when the queue is empty.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is due instead of waiting for new ones.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        autodiscover_jobs()
+        workers = options['workers']
+        if options['processes']:
+            # Spawned workers do not inherit the database connections of this process.
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=init_process_worker)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+
+        self.stopping = False
+        handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            done_count, failed_count = self.run(executor, workers, options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Ran {done_count} jobs, {failed_count} failed."))
+
+    def run(self, executor, workers, options):
+        """
+        Keep the pool busy with claimed jobs and record their outcome.
+        @return: (jobs done, jobs failed)
+        """
+        running = {}
+        done_count = failed_count = 0
+        with executor:
+            while True:
+                if not self.stopping and len(running) < workers:
+                    for job_id, name, job_args in claim_jobs(workers - len(running)):
+                        running[executor.submit(run_job, name, job_args)] = (job_id, name)
+                if not running:
+                    if self.stopping or options['burst']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id, name = running.pop(future)
+                    error = future.result()
+                    finish_job(job_id, error)
+                    if error is None:
+                        done_count += 1
+                    else:
+                        failed_count += 1
+                    if self.verbosity > 1:
+                        self.stdout.write(f"Job {job_id} {name} {'failed' if error else 'done'}.")
+        return done_count, failed_count
+
+    def stop(self, signum, frame):
+        """Stop claiming jobs and exit once the running ones finish."""
+        if self.stopping:
+            raise KeyboardInterrupt
+        self.stopping = True
+        self.stdout.write("Finishing running jobs, interrupt again to exit now.")
@@ -0,0 +1,94 @@
+import random
+from array import array
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from friends.models import FriendRequest, Friendship
+from friends.utils.counters import reconcile_counters
+from users.models import User
+
+
+SEED_PASSWORD = 'Benchmark1!'
+SEED_EMAIL_DOMAIN = 'bench.example.com'
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic social graph with power-law friend degrees, "
+            "for benchmarking. Use a dedicated database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Number of users to create.')
+        parser.add_argument('--min-degree', type=int, default=2, help='Minimum friend degree.')
+        parser.add_argument('--max-degree', type=int, default=5000, help='Maximum friend degree.')
+        parser.add_argument('--alpha', type=float, default=2.0,
+                            help='Pareto shape of the degree distribution (lower is more skewed).')
+        parser.add_argument('--pending', type=float, default=0.1,
+                            help='Fraction of edges left as pending requests.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible graphs.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        user_ids = self.create_users(options['users'], batch_size)
+        self.stdout.write(f"Created {len(user_ids)} users.")
+
+        # Configuration model: every user appears once per friend it should
+        # have, pairing the shuffled stubs yields the edges.
+        stubs = array('q')
+        for user_id in user_ids:
+            degree = int(rng.paretovariate(options['alpha']) * options['min_degree'])
+            stubs.extend([user_id] * min(degree, options['max_degree']))
+        rng.shuffle(stubs)
+
+        accepted = pending = 0
+        requests, friendships = [], []
+        for index in range(0, len(stubs) - 1, 2):
+            first, second = stubs[index], stubs[index + 1]
+            if first == second:
+                continue
+            # A canonical direction lets the unique constraint drop duplicates.
+            sender, receiver = min(first, second), max(first, second)
+            # Decided per pair so that duplicate edges agree on the status.
+            if (sender * 2654435761 + receiver) % 10000 < options['pending'] * 10000:
+                requests.append(FriendRequest(sender_id=sender, receiver_id=receiver))
+                pending += 1
+            else:
+                requests.append(FriendRequest(sender_id=sender, receiver_id=receiver, status='accepted'))
+                friendships.append(Friendship(user_id=sender, friend_id=receiver))
+                friendships.append(Friendship(user_id=receiver, friend_id=sender))
+                accepted += 1
+            if len(requests) >= batch_size:
+                self.flush(requests, friendships)
+                requests, friendships = [], []
+        self.flush(requests, friendships)
+
+        # Bulk inserts bypass CounterDeltas, recount the seeded users.
+        for offset in range(0, len(user_ids), batch_size):
+            reconcile_counters(user_ids[offset:offset + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {accepted} friendships and {pending} pending requests "
+            f"(duplicates are dropped on insert)."))
+
+    def create_users(self, count, batch_size):
+        # Hashing once keeps seeding fast, every user shares SEED_PASSWORD.
+        password = make_password(SEED_PASSWORD)
+        start = User.objects.filter(email__endswith=SEED_EMAIL_DOMAIN).count()
+        for offset in range(0, count, batch_size):
+            User.objects.bulk_create([
+                User(email=f'user{start + number}@{SEED_EMAIL_DOMAIN}',
+                     name=f'Bench User {start + number}',
+                     password=password)
+                for number in range(offset, min(offset + batch_size, count))
+            ], batch_size=batch_size)
+        return list(User.objects.filter(
+            email__endswith=SEED_EMAIL_DOMAIN).order_by('id').values_list('id', flat=True))[start:]
+
+    def flush(self, requests, friendships):
+        with transaction.atomic():
+            FriendRequest.objects.bulk_create(requests, ignore_conflicts=True)
+            Friendship.objects.bulk_create(friendships, ignore_conflicts=True)
@@ -0,0 +1,130 @@
+import logging
+import random
+import time
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core.routers import pin_user, reset_read_alias, set_read_alias
+from core.utils.metrics import REQUEST_LATENCY, SERIALIZATION_TIME, SQL_QUERIES, SQL_TIME
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCollector:
+    """
+    Database execute wrapper recording the number and duration of the
+    queries of one request, and capturing the stack of the query that
+    crosses the view's query budget when the request is sampled.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.budget = None
+        self.sampled = False
+        self.stack = None
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            if self.sampled and self.stack is None and self.budget is not None and self.count > self.budget:
+                self.stack = ''.join(traceback.format_stack(limit=settings.QUERY_BUDGET_STACK_LIMIT))
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL query count, SQL time and response rendering time
+    per resolved URL name, and logs requests exceeding their query budget
+    from QUERY_BUDGETS with a sampled stack trace.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        request._query_collector = collector
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(collector))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        REQUEST_LATENCY.observe(view, total)
+        SQL_QUERIES.observe(view, collector.count)
+        SQL_TIME.observe(view, collector.duration)
+        SERIALIZATION_TIME.observe(view, collector.render_time)
+
+        if collector.budget is not None and collector.count > collector.budget:
+            logger.warning(
+                "Query budget exceeded for %s: %d queries (budget %d, %.1f ms SQL)%s",
+                view, collector.count, collector.budget, collector.duration * 1000,
+                f"\n{collector.stack}" if collector.stack else '',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        collector = request._query_collector
+        url_name = request.resolver_match.url_name
+        collector.budget = settings.QUERY_BUDGETS.get(url_name, settings.QUERY_BUDGET_DEFAULT)
+        collector.sampled = random.random() < settings.QUERY_BUDGET_SAMPLE_RATE
+        return None
+
+    def process_template_response(self, request, response):
+        # Listed first, this runs last, right before the handler renders the
+        # response; the post-render callback closes the measurement.
+        collector = request._query_collector
+        render_started = time.perf_counter()
+
+        def rendered(response):
+            collector.render_time = time.perf_counter() - render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sends the reads of safe requests to a random one of REPLICA_DATABASES.
+    Clients that wrote within REPLICA_PIN_SECONDS read from the primary, so
+    they see their own changes despite replication lag: the write sets a
+    cookie, and pins the user in the cache for token clients that do not
+    keep cookies (checked by CachedJWTAuthentication).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = settings.REPLICA_DATABASES
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        alias = None
+        if replicas and safe and settings.REPLICA_PIN_COOKIE not in request.COOKIES:
+            alias = random.choice(replicas)
+
+        token = set_read_alias(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_read_alias(token)
+
+        if replicas and not safe:
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+            # DRF copies the authenticated user to the underlying request.
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_user(user.id)
+        return response
@@ -28,3 +28,43 @@ class AbstractUserBase(models.Model):
 
     class Meta:
         abstract = True
+
+
+class Job(AbstractDateBase):
+    """
+    Background job queued in the database and run by the run_jobs
+    command, see core.utils.jobs. Finished jobs are deleted, jobs that
+    used up their attempts are kept as failed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255, help_text='Registered name of the job function')
+    args = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # At most one queued job per key, enqueueing another one is a no-op.
+    dedup_key = models.CharField(max_length=255, null=True, blank=True)
+    run_at = models.DateTimeField(help_text='Earliest time the job may run')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    # A running job whose lease expired is assumed lost with its worker.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], condition=models.Q(status='queued'),
+                                    name='job_queued_dedup_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.name} ({self.status})"
@@ -0,0 +1,60 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Replica alias the reads of the current request go to, None for the primary.
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def get_read_alias():
+    return _read_alias.get()
+
+
+def set_read_alias(alias):
+    """
+    Route the following reads of the current context to `alias`, or to
+    the primary for None.
+    @return: token for `reset_read_alias()`
+    """
+    return _read_alias.set(alias)
+
+
+def reset_read_alias(token):
+    _read_alias.reset(token)
+
+
+def replica_pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin_user(user_id):
+    """Keep the reads of a user on the primary for REPLICA_PIN_SECONDS."""
+    caches[settings.REPLICA_PIN_CACHE_ALIAS].set(replica_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def is_user_pinned(user_id):
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS].get(replica_pin_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica picked for the current request by
+    ReplicaRoutingMiddleware, and everything else to the primary. Outside
+    of requests, e.g. in management commands, all reads use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,3 +1,397 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Value
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core.checks import check_shared_caches
+from core.routers import ReplicaRouter, is_user_pinned, pin_user
+from core.models import Job
+from core.utils.jobs import claim_jobs, enqueue, enqueue_many, finish_job, register_job, run_job
+from core.utils.renderers import FastJSONRenderer, msgpack
+from core.utils.search import drop_fts_index, ensure_fts_index
+from core.utils.serialization import get_row_serializer
+from friends.models import FriendRequest, Friendship, FriendshipEvent
+from friends.v1.serializers import (
+    FriendRequestInboxSerializer, FriendSerializer, FriendshipEventSerializer, FriendSuggestionSerializer,
+    UserSummarySerializer)
+from users.authentication import tokens_for_user
+from users.models import User
+from users.v1.serializers import UserListSerializer
+
+
+calls = []
+
+
+@register_job
+def record(value):
+    calls.append(value)
+
+
+@register_job
+def explode(value):
+    raise ValueError(value)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def run_due_jobs(self):
+        jobs = claim_jobs(10)
+        for job_id, name, args in jobs:
+            finish_job(job_id, run_job(name, args))
+        return jobs
+
+    def test_deduplicated_jobs_are_queued_once(self):
+        enqueue_many(record, [(1,), (1,), (2,)], dedup=True)
+        enqueue_many(record, [(1,)], dedup=True)
+        self.assertEqual(Job.objects.count(), 2)
+
+        self.assertEqual(len(self.run_due_jobs()), 2)
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertFalse(Job.objects.exists())
+
+    def test_claimed_job_does_not_absorb_a_new_one(self):
+        enqueue_many(record, [(1,)], dedup=True)
+        [(job_id, name, args)] = claim_jobs(10)
+        enqueue_many(record, [(1,)], dedup=True)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+        finish_job(job_id, run_job(name, args))
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    def test_on_commit_jobs_wait_for_the_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            enqueue(record, 1, on_commit=True)
+            self.assertFalse(Job.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Job.objects.count(), 1)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_with_backoff_then_kept(self):
+        enqueue(explode, 'boom')
+        with self.assertLogs('core.utils.jobs', 'WARNING'):
+            self.run_due_jobs()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(claim_jobs(10), [])
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.utils.jobs', 'ERROR'):
+            self.run_due_jobs()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(claim_jobs(10), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        enqueue(record, 1)
+        claim_jobs(10)
+        Job.objects.update(locked_until=timezone.now())
+        [(job_id, name, args)] = claim_jobs(10)
+        self.assertEqual(Job.objects.get(id=job_id).attempts, 2)
+
+    def test_unregistered_function_is_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue(print, 1)
+
+
+class ImportGraphTests(TestCase):
+
+    def setUp(self):
+        self.a, self.b, self.c, self.d = [User.objects.create_user(email=f'user{i}@example.com', name=f'User {i}')
+                                          for i in range(4)]
+
+    def import_requests(self, records):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as stream:
+            stream.write(''.join(json.dumps(record) + '\n' for record in records))
+            stream.flush()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_graph', 'friend-requests', stream.name, stdout=StringIO(), stderr=StringIO())
+
+    def test_only_inserted_accepted_requests_are_linked(self):
+        FriendRequest.objects.create(sender=self.a, receiver=self.b, status='rejected')
+        FriendRequest.objects.create(sender=self.d, receiver=self.c)
+        self.import_requests([
+            {'sender': self.a.email, 'receiver': self.b.email, 'status': 'accepted'},
+            {'sender': self.a.email, 'receiver': self.c.email, 'status': 'accepted'},
+            {'sender': self.b.email, 'receiver': self.c.email},
+            {'sender': self.c.email, 'receiver': self.d.email, 'status': 'accepted'},
+        ])
+
+        self.assertEqual(FriendRequest.objects.get(sender=self.a, receiver=self.b).status, 'rejected')
+        self.assertFalse(FriendRequest.objects.filter(sender=self.c, receiver=self.d).exists())
+        self.assertEqual(set(Friendship.objects.values_list('user_id', 'friend_id')),
+                         {(self.a.id, self.c.id), (self.c.id, self.a.id)})
+        self.assertEqual(set(FriendshipEvent.objects.filter(user=self.c).values_list('actor_id', 'action')),
+                         {(self.c.id, 'accepted'), (self.b.id, 'sent')})
+
+    def test_counters_are_reconciled(self):
+        self.import_requests([
+            {'sender': self.a.email, 'receiver': self.b.email, 'status': 'accepted'},
+            {'sender': self.a.email, 'receiver': self.c.email},
+        ])
+        counters = {user.id: (user.friends_count, user.pending_sent_count, user.pending_received_count)
+                    for user in User.objects.all()}
+        self.assertEqual(counters[self.a.id], (1, 1, 0))
+        self.assertEqual(counters[self.b.id], (1, 0, 0))
+        self.assertEqual(counters[self.c.id], (0, 0, 1))
+
+
+class SeedGraphTests(TestCase):
+
+    def test_seeded_counters_match_the_graph(self):
+        call_command('seed_graph', users=50, max_degree=10, pending=0.3, stdout=StringIO())
+        for user in User.objects.all():
+            self.assertEqual(user.friends_count, Friendship.objects.filter(user=user).count())
+            self.assertEqual(user.pending_sent_count,
+                             FriendRequest.objects.filter(sender=user, status='pending').count())
+            self.assertEqual(user.pending_received_count,
+                             FriendRequest.objects.filter(receiver=user, status='pending').count())
+        self.assertTrue(User.objects.filter(friends_count__gt=0).exists())
+
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.viewer = User.objects.create_user(email='viewer@example.com', name='Viewer')
+        self.users = [User.objects.create_user(email=f'user{i}@example.com', name=f'User {i}') for i in range(7)]
+        # Ties on created_on are broken by the id.
+        User.objects.filter(id__in=[user.id for user in self.users[2:5]]).update(
+            created_on=self.users[2].created_on)
+
+    def get(self, path):
+        return self.client.get(path, HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.viewer).access_token}')
+
+    def test_pages_stay_stable_while_users_are_added(self):
+        seen = []
+        response = self.get('/users/api/v1/users/?page_size=2')
+        while True:
+            data = response.json()['data']
+            seen.extend(user['id'] for user in data['results'])
+            if not data['next']:
+                break
+            if len(seen) == 2:
+                with self.captureOnCommitCallbacks(execute=True):
+                    User.objects.create_user(email='late@example.com', name='Late')
+            response = self.get(data['next'])
+
+        expected = User.objects.filter(id__in=[user.id for user in self.users]).order_by('-created_on', '-id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+
+
+    def test_count_is_shared_by_every_user(self):
+        data = self.get('/users/api/v1/users/').json()['data']
+        self.assertEqual(data['count'], len(self.users))
+
+        other = self.users[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/users/api/v1/users/',
+                                       HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(other).access_token}')
+        self.assertEqual(response.json()['data']['count'], len(self.users))
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+
+class SearchTests(TestCase):
+    """Runs against the FTS5 index on SQLite and the trigram indexes on PostgreSQL."""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.viewer = User.objects.create_user(email='viewer@example.com', name='Viewer')
+        self.ada = User.objects.create_user(email='ada@example.com', name='Ada Lovelace', location='London')
+        self.grace = User.objects.create_user(email='grace@example.com', name='Grace Hopper', location='Arlington')
+
+    def search(self, term):
+        response = self.client.get('/users/api/v1/users/', {'search': term},
+                                   HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.viewer).access_token}')
+        return [user['id'] for user in response.json()['data']['results']]
+
+    def test_matches_name_email_and_location(self):
+        self.assertEqual(self.search('Lovelace'), [self.ada.id])
+        self.assertEqual(self.search('grace@example.com'), [self.grace.id])
+        self.assertEqual(self.search('Arlington'), [self.grace.id])
+        self.assertEqual(self.search('Babbage'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(id=self.ada.id).update(name='Ada Byron')
+        self.assertEqual(self.search('Byron'), [self.ada.id])
+        self.assertEqual(self.search('Lovelace'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grace.delete()
+        self.assertEqual(self.search('Hopper'), [])
+
+    def test_missing_fts_index_is_rebuilt(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 index is SQLite only.')
+        table, fields = User._meta.db_table, ['name', 'email', 'location']
+        self.assertFalse(ensure_fts_index(connection, table, User._meta.pk.column, fields))
+        drop_fts_index(connection, table)
+        self.assertTrue(ensure_fts_index(connection, table, User._meta.pk.column, fields))
+        self.assertEqual(self.search('Lovelace'), [self.ada.id])
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    @override_settings(DEBUG=False)
+    def test_process_local_caches_are_reported(self):
+        warnings = check_shared_caches(None)
+        self.assertEqual({warning.id for warning in warnings}, {'core.W001'})
+        self.assertEqual(len(warnings), 3)
+
+    @override_settings(DEBUG=False, CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'friends': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'},
+    })
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_caches(None), [])
+
+
+class ReplicaRoutingTests(TestCase):
+    """
+    Runs against a second SQLite file registered as a replica, holding a
+    stale copy of the user so that every read shows where it went.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor != 'sqlite':
+            raise unittest.SkipTest('The replica is a copy of the SQLite test database.')
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.replica_dir.name, 'replica.sqlite3')
+        connection.ensure_connection()
+        replica = sqlite3.connect(path)
+        connection.connection.backup(replica)
+        replica.close()
+        super().setUpClass()
+        # Registered once the test runner set up its databases, so that it
+        # does not make the replica a mirror of the primary.
+        connections.settings['replica1'] = {**connection.settings_dict, 'NAME': path}
+        cls.databases = {'default', 'replica1'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        del cls.databases
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(email='ada@example.com', name='Ada Lovelace')
+        stale = User.objects.get(pk=self.user.pk)
+        stale.name = 'Ada Byron'
+        User.objects.using('replica1').bulk_create([stale])
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(self.user).access_token}'}
+        replicas = self.settings(REPLICA_DATABASES=['replica1'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+
+    def profile_name(self):
+        response = self.client.get('/users/api/v1/profile/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']['name']
+
+    def test_get_reads_from_the_replica(self):
+        self.assertEqual(self.profile_name(), 'Ada Byron')
+
+    def test_unsafe_request_pins_the_client(self):
+        response = self.client.patch('/users/api/v1/profile/', {'name': 'Ada King'},
+                                     content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[settings.REPLICA_PIN_COOKIE].value, '1')
+        self.assertTrue(is_user_pinned(self.user.id))
+        # The client now sends the cookie and reads its own write.
+        self.assertEqual(self.profile_name(), 'Ada King')
+
+    def test_pinned_user_reads_from_the_primary(self):
+        # A token client without cookies is pinned through the cache.
+        pin_user(self.user.id)
+        self.assertEqual(self.profile_name(), 'Ada Lovelace')
+
+        caches[settings.REPLICA_PIN_CACHE_ALIAS].clear()
+        self.client.cookies[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(self.profile_name(), 'Ada Lovelace')
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(self.profile_name(), 'Ada Byron')
+        self.assertIsNone(ReplicaRouter().db_for_read(User))
+        self.assertEqual(User.objects.get(pk=self.user.pk).name, 'Ada Lovelace')
+
+        out = StringIO()
+        with redirect_stdout(out):
+            call_command('shell', command='from users.models import User; print(User.objects.get().name)',
+                         verbosity=0)
+        self.assertEqual(out.getvalue().strip(), 'Ada Lovelace')
+
+
+class FastSerializationTests(TestCase):
+    """The fast paths must produce the same bytes as stock DRF."""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.ada = User.objects.create_user(
+            email='ada@example.com', name='Ada Lövelace 李', bio='Line\u2028separator\u2029', location=None,
+            birth_date=datetime.date(1815, 12, 10))
+        self.ada.profile_picture_hash = 'a' * 32
+        self.ada.save(update_fields=['profile_picture_hash'])
+        self.grace = User.objects.create_user(email='grace@example.com', name='Grace Hopper', bio=None)
+        request = FriendRequest.objects.create(sender=self.ada, receiver=self.grace)
+        FriendshipEvent.objects.create(user=self.grace, actor=self.ada, target=self.grace, action='sent',
+                                       request_id=request.id)
+        FriendshipEvent.objects.create(user=self.grace, actor=self.grace, target=self.ada, action='rejected')
+
+    def assertSameOutput(self, serializer_class, queryset):
+        row_serializer = get_row_serializer(serializer_class)
+        self.assertIsNotNone(row_serializer)
+        data = serializer_class(queryset, many=True).data
+        rows = row_serializer.many(row_serializer.values(queryset))
+        self.assertEqual(rows, data)
+        self.assertEqual(FastJSONRenderer().render(rows), JSONRenderer().render(data))
+
+    def test_list_serializers_match_drf(self):
+        users = User.objects.order_by('id')
+        for serializer_class in (UserListSerializer, FriendSerializer, UserSummarySerializer):
+            with self.subTest(serializer_class.__name__):
+                self.assertSameOutput(serializer_class, users)
+        self.assertSameOutput(FriendSuggestionSerializer, users.annotate(mutual_friends=Value(2)))
+        self.assertSameOutput(FriendRequestInboxSerializer, FriendRequest.objects.order_by('id'))
+        self.assertSameOutput(FriendshipEventSerializer, FriendshipEvent.objects.order_by('id'))
+
+    def test_renderer_escapes_like_drf(self):
+        data = {'text': 'Zoë \u2028 \u2029 \u00e9 😀', 'none': None, 'when': timezone.now(),
+                'day': timezone.now().date(), 'nested': [{'id': 1}]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed.')
+    def test_msgpack_is_negotiated(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(self.grace).access_token}'}
+        response = self.client.get('/users/api/v1/users/', HTTP_ACCEPT='application/msgpack', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        json_response = self.client.get('/users/api/v1/users/', **auth)
+        self.assertEqual(msgpack.unpackb(response.content), json_response.json())
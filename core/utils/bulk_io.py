@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import sys
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+FORMATS = (NDJSON, CSV)
+
+
+def guess_format(path, default=NDJSON):
+    """Infer the record format from a file extension."""
+    if path.endswith('.csv'):
+        return CSV
+    if path.endswith(('.ndjson', '.jsonl')):
+        return NDJSON
+    return default
+
+
+def open_stream(path, mode):
+    """Open `path`, or stdin / stdout for '-'."""
+    if path == '-':
+        return (sys.stdin if 'r' in mode else sys.stdout), False
+    return open(path, mode, newline='', encoding='utf-8'), True
+
+
+def read_records(stream, fmt):
+    """
+    Lazily yield (line number, dict) pairs from an NDJSON or CSV stream.
+    Empty CSV cells are returned as None.
+    """
+    if fmt == CSV:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {key: value or None for key, value in record.items()}
+        return
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            yield number, json.loads(line)
+
+
+class RecordWriter:
+    """Write dicts with a fixed set of fields as NDJSON or CSV."""
+
+    def __init__(self, stream, fmt, fields):
+        self.stream = stream
+        self.fields = fields
+        self.fmt = fmt
+        if fmt == CSV:
+            self.writer = csv.writer(stream)
+            self.writer.writerow(fields)
+
+    def write(self, values):
+        if self.fmt == CSV:
+            self.writer.writerow(['' if value is None else value for value in values])
+        elif orjson is not None:
+            self.stream.write(orjson.dumps(dict(zip(self.fields, values))).decode() + '\n')
+        else:
+            self.stream.write(json.dumps(dict(zip(self.fields, values)), cls=DjangoJSONEncoder) + '\n')
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def init_hash_worker():
+    # Spawned workers start without configured apps, forked ones are no-ops.
+    django.setup()
+
+
+def hash_password(password):
+    return make_password(password)
+
+
+def hash_passwords(executor, passwords, chunksize=16):
+    """
+    Hash plain text passwords, in the worker processes of `executor` when
+    given. None yields an unusable password, like set_password(None).
+    @param executor: ProcessPoolExecutor or None
+    @param passwords: list of plain text passwords
+    @param chunksize: passwords sent to a worker at once
+    @return: list of encoded passwords
+    """
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    return list(executor.map(hash_password, passwords, chunksize=chunksize))
+
+
+def insert_objects(model, objs, use_copy=False, returning=None):
+    """
+    Insert unsaved instances, ignoring rows that conflict with existing ones.
+    @param use_copy: load through PostgreSQL COPY instead of INSERT
+    @param returning: optional field names to return for the inserted rows
+    @return: number of inserted rows, or None when bulk_create cannot tell.
+             With `returning`, a list of value tuples of the rows inserted
+             here, rows skipped on a conflict are left out.
+    """
+    if not objs:
+        return [] if returning else 0
+    if use_copy and connection.vendor == 'postgresql':
+        return copy_insert(model, objs, returning)
+    if returning:
+        return insert_returning(model, objs, returning)
+    model.objects.bulk_create(objs, ignore_conflicts=True)
+    return None
+
+
+def insert_fields(model):
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def returning_clause(model, returning):
+    return ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in returning)
+
+
+def insert_returning(model, objs, returning):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING, which unlike bulk_create
+    only reports the rows it inserted (PostgreSQL, SQLite 3.35+).
+    @return: list of value tuples of the `returning` fields
+    """
+    fields = insert_fields(model)
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = f"({', '.join(['%s'] * len(fields))})"
+    rows = []
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            params = [field.get_db_prep_save(field.pre_save(obj, True), connection)
+                      for obj in batch for field in fields]
+            cursor.execute(f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholders] * len(batch))} "
+                           f"ON CONFLICT DO NOTHING RETURNING {returning_clause(model, returning)}", params)
+            rows.extend(cursor.fetchall())
+    return rows
+
+
+def copy_insert(model, objs, returning=None):
+    """
+    Insert model instances with PostgreSQL COPY, skipping rows that
+    conflict with existing ones. Rows are copied into a temporary table
+    first since COPY itself cannot ignore conflicts. Must be called inside
+    a transaction.
+    @param model: model class
+    @param objs: unsaved instances
+    @param returning: optional field names to return for the inserted rows
+    @return: number of inserted rows, or with `returning` their values
+    """
+    fields = insert_fields(model)
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objs:
+        row = []
+        for field in fields:
+            value = field.get_db_prep_save(field.pre_save(obj, True), connection)
+            row.append('\\N' if value is None else value)
+        writer.writerow(row)
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE bulk_import ON COMMIT DROP AS "
+                       f"SELECT {columns} FROM {table} WITH NO DATA")
+        cursor.copy_expert(
+            f"COPY bulk_import ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM bulk_import "
+                       f"ON CONFLICT DO NOTHING"
+                       + (f" RETURNING {returning_clause(model, returning)}" if returning else ""))
+        inserted = cursor.fetchall() if returning else cursor.rowcount
+        cursor.execute("DROP TABLE bulk_import")
+    return inserted
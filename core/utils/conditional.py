@@ -0,0 +1,108 @@
+import hashlib
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def version_cache():
+    return caches[settings.VERSION_CACHE_ALIAS]
+
+
+def version_key(scope, *parts):
+    return ':'.join(('version', scope) + tuple(str(part) for part in parts))
+
+
+def version_timeout(key):
+    """Lifetime of a version, VERSION_CACHE_TIMEOUTS overrides it per scope."""
+    return settings.VERSION_CACHE_TIMEOUTS.get(key.split(':')[1], settings.VERSION_CACHE_TIMEOUT)
+
+
+def get_versions(keys):
+    """
+    Return the current version of every key. A version is the time of the
+    last change, keys that are missing from the cache start at now.
+    @param keys: list of version keys
+    @return: list of versions, in the order of `keys`
+    """
+    cache = version_cache()
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            # add() keeps a version another process set in the meantime.
+            if not cache.add(key, version, version_timeout(key)):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def get_request_versions(view, request):
+    """
+    Versions of the view's `get_version_keys()`, read once per request and
+    shared by the mixins that depend on them.
+    """
+    if not hasattr(request, '_versions'):
+        request._versions = get_versions(view.get_version_keys(request))
+    return request._versions
+
+
+def bump_versions(*keys):
+    """Mark the data behind the given version keys as changed."""
+    now = time.time()
+    by_timeout = defaultdict(dict)
+    for key in keys:
+        by_timeout[version_timeout(key)][key] = now
+    for timeout, versions in by_timeout.items():
+        version_cache().set_many(versions, timeout)
+
+
+class ConditionalGetMixin:
+    """
+    Answers GET requests with `304 Not Modified` when the client already
+    holds the current representation, before running the view's queries.
+
+    Views list the version keys their response depends on in
+    `get_version_keys()`. The ETag is derived from those versions, the
+    user, the full path and the negotiated format, and Last-Modified from
+    the newest version, so validating a request costs one cache read and
+    no SQL. Generic views get this for free, views defining their own
+    `get()` wrap it with `conditional_response()`.
+    """
+
+    def get_version_keys(self, request):
+        raise NotImplementedError
+
+    def get_validators(self, request):
+        versions = get_request_versions(self, request)
+        fingerprint = '{}:{}:{}:{}'.format(
+            request.user.id,
+            request.get_full_path(),
+            request.accepted_media_type,
+            ','.join(repr(version) for version in versions),
+        )
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        return etag, int(max(versions))
+
+    def conditional_response(self, request, get_response):
+        """
+        Return `304 Not Modified` if the client's validators match,
+        otherwise the response built by calling `get_response()`.
+        """
+        etag, last_modified = self.get_validators(request)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = get_response()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs))
@@ -0,0 +1,16 @@
+import signal
+
+import django
+
+
+def init_process_worker():
+    """
+    Initializer of the run_jobs worker processes. They are spawned fresh,
+    so this module must not import models before Django is set up.
+    """
+    # Interrupts are handled by the claiming process, which lets running jobs finish.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+    from core.utils.jobs import autodiscover_jobs
+    autodiscover_jobs()
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Job functions by name, filled by `register_job`. Workers import the
+# `jobs` module of every installed app to find them.
+_registry = {}
+
+
+def job_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def register_job(func):
+    """
+    Decorator making a function runnable by the run_jobs workers. Its
+    arguments are stored as JSON, so they must be JSON serializable.
+    """
+    _registry[job_name(func)] = func
+    return func
+
+
+def autodiscover_jobs():
+    autodiscover_modules('jobs')
+
+
+def dedup_key_for(func, args):
+    """Key shared by the jobs calling `func` with the same arguments."""
+    payload = json.dumps([job_name(func), list(args)], separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue(func, *args, dedup_key=None, delay=None, on_commit=False):
+    """
+    Queue a call of a registered job function.
+    @param func: function decorated with `register_job`
+    @param args: JSON serializable arguments
+    @param dedup_key: optional key, the job is dropped while another job
+                      with the same key is still queued
+    @param delay: optional timedelta to wait before running the job
+    @param on_commit: queue the job once the current transaction commits,
+                      instead of as part of it
+    """
+    enqueue_many(func, [args], delay=delay, on_commit=on_commit,
+                 dedup_keys=None if dedup_key is None else [dedup_key])
+
+
+def enqueue_many(func, arg_lists, dedup=False, delay=None, on_commit=False, dedup_keys=None):
+    """
+    Queue many calls of a registered job function with a single insert.
+    @param func: function decorated with `register_job`
+    @param arg_lists: list of argument tuples, one per job
+    @param dedup: derive a dedup key from the function and the arguments
+    @param delay: optional timedelta to wait before running the jobs
+    @param on_commit: queue the jobs once the current transaction commits
+    @param dedup_keys: explicit dedup keys, in the order of `arg_lists`
+    """
+    name = job_name(func)
+    if name not in _registry:
+        raise ValueError(f"{name} is not a registered job.")
+    if on_commit:
+        transaction.on_commit(lambda: enqueue_many(func, arg_lists, dedup=dedup, delay=delay,
+                                                   dedup_keys=dedup_keys))
+        return
+
+    if dedup_keys is None:
+        dedup_keys = [dedup_key_for(func, args) if dedup else None for args in arg_lists]
+    run_at = timezone.now() + (delay or timedelta())
+    Job.objects.bulk_create([
+        Job(name=name, args=list(args), dedup_key=key, run_at=run_at,
+            max_attempts=settings.JOB_MAX_ATTEMPTS)
+        for args, key in zip(arg_lists, dedup_keys)
+    ], ignore_conflicts=True)
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff with jitter before the next attempt.
+    @param attempts: number of attempts made so far
+    @return: timedelta
+    """
+    ceiling = min(settings.JOB_RETRY_BACKOFF_MAX, settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1))
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def claim_jobs(limit):
+    """
+    Lease up to `limit` due jobs to the calling worker. Jobs whose lease
+    expired are claimed again, or failed once out of attempts. Locked rows
+    are skipped, so concurrent workers claim disjoint jobs on PostgreSQL.
+    @return: list of (job ID, name, args)
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        Job.objects.filter(
+            status=Job.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')
+        ).update(status=Job.FAILED, locked_until=None, last_error='Lease expired.', modified_on=now)
+        jobs = list(Job.objects.filter(
+            Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+        ).order_by('run_at', 'id').select_for_update(skip_locked=True).values_list('id', 'name', 'args')[:limit])
+        if jobs:
+            Job.objects.filter(id__in=[job_id for job_id, _, _ in jobs]).update(
+                status=Job.RUNNING,
+                attempts=F('attempts') + 1,
+                locked_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                modified_on=now,
+            )
+    return jobs
+
+
+def run_job(name, args):
+    """
+    Run a claimed job in a pool worker. Exceptions are returned rather
+    than raised, so they reach the claiming process from any pool.
+    @return: None on success, the formatted traceback otherwise
+    """
+    close_old_connections()
+    try:
+        func = _registry.get(name)
+        if func is None:
+            raise LookupError(f"{name} is not a registered job.")
+        func(*args)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+    return None
+
+
+def finish_job(job_id, error=None):
+    """
+    Delete a successful job, or queue a failed one again after a backoff
+    until it runs out of attempts.
+    """
+    if error is None:
+        Job.objects.filter(id=job_id).delete()
+        return
+
+    job = Job.objects.filter(id=job_id).values('name', 'attempts', 'max_attempts').first()
+    if job is None:
+        return
+    now = timezone.now()
+    if job['attempts'] >= job['max_attempts']:
+        logger.error(f"Job {job_id} {job['name']} failed after {job['attempts']} attempts: {error}")
+        Job.objects.filter(id=job_id).update(status=Job.FAILED, locked_until=None, last_error=error,
+                                             modified_on=now)
+        return
+
+    logger.warning(f"Job {job_id} {job['name']} failed, attempt {job['attempts']}: {error}")
+    try:
+        with transaction.atomic():
+            Job.objects.filter(id=job_id).update(status=Job.QUEUED, locked_until=None, last_error=error,
+                                                 run_at=now + retry_delay(job['attempts']), modified_on=now)
+    except IntegrityError:
+        # A job with the same dedup key was queued meanwhile and covers this one.
+        Job.objects.filter(id=job_id).delete()
+
+
+def queue_metrics():
+    """Queue depth and age gauges for /metrics/, from the primary database."""
+    rows = Job.objects.using(DEFAULT_DB_ALIAS).values('status').annotate(
+        jobs=Count('id'), oldest=Min('run_at')).order_by()
+    depth = {status: (0, None) for status, _ in Job.STATUS_CHOICES}
+    depth.update({row['status']: (row['jobs'], row['oldest']) for row in rows})
+    now = timezone.now()
+    lines = ['# HELP social_app_jobs Background jobs by status.', '# TYPE social_app_jobs gauge']
+    lines.extend(f'social_app_jobs{{status="{status}"}} {jobs}' for status, (jobs, _) in depth.items())
+    oldest = depth[Job.QUEUED][1]
+    lines.extend([
+        '# HELP social_app_jobs_oldest_queued_seconds Time the oldest due queued job has been waiting.',
+        '# TYPE social_app_jobs_oldest_queued_seconds gauge',
+        f'social_app_jobs_oldest_queued_seconds {max((now - oldest).total_seconds(), 0) if oldest else 0}',
+    ])
+    return lines
@@ -0,0 +1,80 @@
+import threading
+from bisect import bisect_left
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    """
+    Minimal thread-safe Prometheus histogram with a single `view` label.
+    Values are kept per process.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, view, value):
+        with self.lock:
+            series = self.series.get(view)
+            if series is None:
+                series = self.series[view] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def collect(self):
+        """Render the histogram in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {view: dict(series, buckets=list(series['buckets'])) for view, series in self.series.items()}
+        for view, series in sorted(snapshot.items()):
+            label = escape_label(view)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{view="{label}",le="+Inf"}} {series["count"]}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {series["sum"]}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {series["count"]}')
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = Histogram(
+    'social_app_request_duration_seconds', 'Total request latency per view.', LATENCY_BUCKETS)
+SQL_QUERIES = Histogram(
+    'social_app_sql_queries', 'SQL queries executed per request.', QUERY_COUNT_BUCKETS)
+SQL_TIME = Histogram(
+    'social_app_sql_duration_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS)
+SERIALIZATION_TIME = Histogram(
+    'social_app_serialization_duration_seconds', 'Time spent rendering the response body.', LATENCY_BUCKETS)
+
+HISTOGRAMS = [REQUEST_LATENCY, SQL_QUERIES, SQL_TIME, SERIALIZATION_TIME]
+
+# Callables returning extra exposition lines, e.g. gauges owned by other apps.
+_collectors = []
+
+
+def register_collector(collector):
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.collect())
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
@@ -1,16 +1,67 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
 
+def estimated_count(queryset):
+    """
+    Util method returning a cheap row count for pagination metadata.
+    On PostgreSQL it comes from the planner: the table statistics for an
+    unfiltered queryset, the plan's row estimate for a filtered one.
+    Anything else is counted once and cached for
+    PAGINATION_COUNT_CACHE_TIMEOUT seconds, keyed by the SQL, so querysets
+    meant to share a count must not filter on the requesting user.
+    @param queryset: queryset to count
+    @return: estimated number of rows
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 until the table has been analyzed.
+            if row and row[0] >= 0:
+                return row[0]
+        else:
+            try:
+                plan = json.loads(queryset.order_by().explain(format='json'))
+            except EmptyResultSet:
+                return 0
+            return int(plan[0]['Plan']['Plan Rows'])
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = 'pagination-count:' + hashlib.md5(
+        f"{queryset.db}:{sql}:{params}".encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
 class UserListPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    message = "Users fetched successfully."
 
     def get_paginated_response(self, data):
         return Response({
             'success': True,
-            'message': "Users fetched successfully.",
+            'message': self.message,
             'data': {
                 'count': self.page.paginator.count,
                 'total_pages': self.page.paginator.num_pages,
@@ -20,3 +71,54 @@ class UserListPagination(PageNumberPagination):
                 'results': data,
             }
         })
+
+
+class MutualFriendsPagination(UserListPagination):
+    message = "Mutual friends fetched successfully."
+
+
+class UserListCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the indexed (created_on, id) key, so deep pages
+    cost the same as the first one. The count is estimated or cached
+    instead of being computed on every page. Views can provide a cheaper
+    estimate with `get_estimated_count()`.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_on', '-id')
+    message = "Users fetched successfully."
+
+    def get_ordering(self, request, queryset, view):
+        # Searches annotated by IndexedSearchFilter are paged by relevance.
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank',) + tuple(self.ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.queryset = queryset
+        self.view = view
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self):
+        get_estimated_count = getattr(self.view, 'get_estimated_count', None)
+        if get_estimated_count is not None:
+            return get_estimated_count()
+        return estimated_count(self.queryset)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'success': True,
+            'message': self.message,
+            'data': {
+                'count': self.get_count(),
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data,
+            }
+        })
+
+
+class FriendRequestCursorPagination(UserListCursorPagination):
+    message = "Friend requests received."
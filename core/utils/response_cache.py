@@ -0,0 +1,110 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from core.utils.conditional import get_request_versions
+from core.utils.metrics import escape_label
+
+
+HITS = 'hits'
+MISSES = 'misses'
+
+# Names of the views using CachedResponseMixin, whose stats are reported.
+_cached_views = set()
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def stats_key(view_name, outcome):
+    return f"response-cache:{outcome}:{view_name}"
+
+
+def record(view_name, outcome):
+    cache = response_cache()
+    key = stats_key(view_name, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add() and incr()
+            cache.add(key, 1, None)
+
+
+def response_cache_stats(view_names):
+    """
+    Return the hit and miss counters of the response cache.
+    @param view_names: names of the cached views
+    @return: dict of view name -> {'hits': int, 'misses': int}
+    """
+    keys = {stats_key(name, outcome): (name, outcome)
+            for name in view_names for outcome in (HITS, MISSES)}
+    values = response_cache().get_many(keys)
+    stats = {name: {HITS: 0, MISSES: 0} for name in view_names}
+    for key, value in values.items():
+        name, outcome = keys[key]
+        stats[name][outcome] = value
+    return stats
+
+
+def response_cache_metrics():
+    """Hit and miss counters of every cached view for /metrics/."""
+    lines = ['# HELP social_app_response_cache_requests_total Response cache lookups per view and outcome.',
+             '# TYPE social_app_response_cache_requests_total counter']
+    for name, stats in sorted(response_cache_stats(sorted(_cached_views)).items()):
+        for outcome, value in stats.items():
+            lines.append(f'social_app_response_cache_requests_total'
+                         f'{{view="{escape_label(name)}",outcome="{outcome}"}} {value}')
+    return lines
+
+
+class CachedResponseMixin:
+    """
+    Caches the data of successful GET responses per user and query string.
+
+    The cache key embeds the versions returned by `get_version_keys()`, so
+    bumping a version invalidates every affected entry in O(1) without
+    scanning for keys, and stale entries simply expire. Responses carry an
+    `X-Cache: HIT` / `MISS` header and hits and misses are counted per view.
+    """
+    response_cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _cached_views.add(cls.__name__)
+
+    def get_version_keys(self, request):
+        raise NotImplementedError
+
+    def get_response_cache_key(self, request):
+        versions = get_request_versions(self, request)
+        fingerprint = '{}:{}:{}:{}:{}:{}'.format(
+            type(self).__name__,
+            request.user.id,
+            request.get_host(),
+            sorted(request.query_params.lists()),
+            request.accepted_media_type,
+            ','.join(repr(version) for version in versions),
+        )
+        return 'response:' + hashlib.md5(fingerprint.encode()).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        view_name = type(self).__name__
+        cache = response_cache()
+        key = self.get_response_cache_key(request)
+
+        data = cache.get(key)
+        if data is not None:
+            record(view_name, HITS)
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        record(view_name, MISSES)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.response_cache_timeout or settings.RESPONSE_CACHE_TIMEOUT
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+from rest_framework.filters import SearchFilter
+
+
+def fts_table(model):
+    """Name of the FTS5 table mirroring `model` on SQLite."""
+    return f"{model._meta.db_table}_fts"
+
+
+def ensure_fts_index(connection, table, pk, fields):
+    """
+    Util method to make sure the SQLite FTS5 table mirroring `table` exists
+    and is kept in sync by triggers. SQLite rebuilds a table on most schema
+    changes, which silently drops its triggers, so this is run by the
+    migration creating the index and after every migrate. The index is only
+    rebuilt when the table or a trigger was missing.
+    @param connection: SQLite database connection
+    @param table: name of the mirrored table
+    @param pk: primary key column of the mirrored table
+    @param fields: columns to index
+    @return: True if the index was (re)created
+    """
+    fts = f"{table}_fts"
+    triggers = [f"{fts}_ai", f"{fts}_ad", f"{fts}_au"]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join(['%s'] * 4)})", [fts, *triggers])
+        if cursor.fetchone()[0] == 4:
+            return False
+
+        columns = ', '.join(fields)
+        new_values = ', '.join(f'new.{field}' for field in fields)
+        old_values = ', '.join(f'old.{field}' for field in fields)
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{columns}, content='{table}', content_rowid='{pk}', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {new_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {new_values}); END",
+            # Rows written while the triggers were missing are indexed again.
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+        for statement in statements:
+            cursor.execute(statement)
+    return True
+
+
+def drop_fts_index(connection, table):
+    """Util method to drop the SQLite FTS5 table of `table` and its triggers."""
+    fts = f"{table}_fts"
+    with connection.cursor() as cursor:
+        for trigger in (f"{fts}_au", f"{fts}_ad", f"{fts}_ai"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def fts_query(search_fields, terms):
+    """
+    Util method to build an FTS5 MATCH expression restricted to the given
+    columns, requiring every term to match.
+    @param search_fields: column names to search
+    @param terms: list of search terms
+    @return: FTS5 query string
+    """
+    phrases = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    return '{%s} : (%s)' % (' '.join(search_fields), phrases)
+
+
+class IndexedSearchFilter(SearchFilter):
+    """
+    Multi-field search that can use an index instead of scanning the table.
+
+    On PostgreSQL the search fields are matched with trigram word similarity,
+    served by the `gin_trgm_ops` indexes. On SQLite they are matched through
+    the `<table>_fts` FTS5 table. Matches are annotated with `search_rank`
+    (higher is more relevant) and ordered by it unless the queryset already
+    carries its own ordering. Short terms, or any other database, fall back
+    to the stock `icontains` search.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+        if min(len(term) for term in search_terms) < settings.SEARCH_MIN_TERM_LENGTH:
+            return super().filter_queryset(request, queryset, view)
+
+        vendor = connections[queryset.db].vendor
+        if vendor == 'postgresql':
+            queryset = self.filter_trigram(queryset, search_fields, search_terms)
+        elif vendor == 'sqlite':
+            queryset = self.filter_fts(queryset, search_fields, search_terms)
+        else:
+            return super().filter_queryset(request, queryset, view)
+
+        if not queryset.ordered:
+            queryset = queryset.order_by('-search_rank')
+        return queryset
+
+    def filter_trigram(self, queryset, search_fields, search_terms):
+        term = ' '.join(search_terms)
+        similarities = [TrigramWordSimilarity(term, field) for field in search_fields]
+        condition = Q()
+        for field in search_fields:
+            condition |= Q(**{f'{field}__trigram_word_similar': term})
+        return queryset.filter(condition).annotate(
+            search_rank=Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+        )
+
+    def filter_fts(self, queryset, search_fields, search_terms):
+        table = fts_table(queryset.model)
+        pk_column = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+        query = fts_query(search_fields, search_terms)
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [query])
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT -bm25({table}) FROM {table} WHERE {table} MATCH %s AND rowid = {pk_column}",
+                [query]
+            )
+        )
@@ -0,0 +1,142 @@
+from functools import lru_cache
+
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+# Fields whose to_representation() is the identity for the values returned
+# by the database driver, so the raw value can be emitted as is.
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+)
+
+
+class ConvertedField(serializers.Field):
+    """
+    Read-only field rendering a single column through `to_representation()`,
+    which the row compiler applies to the `values()` rows as well.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+
+class ValuesRowSerializer:
+    """
+    Read-only fast path for a DRF serializer.
+
+    The serializer's fields are compiled once into a list of database
+    lookups and per-field extractors, and rows are then built straight from
+    `QuerySet.values()` dicts instead of model instances. The output is
+    identical to the source serializer's `data`.
+    """
+
+    def __init__(self, lookups, extractors):
+        self.lookups = lookups
+        self.extractors = extractors
+
+    def values(self, queryset, *extra_lookups):
+        lookups = self.lookups + [lookup for lookup in extra_lookups if lookup not in self.lookups]
+        return queryset.values(*lookups)
+
+    def to_representation(self, row):
+        return {name: extract(row) for name, extract in self.extractors}
+
+    def many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+
+def _compile_fields(serializer, prefix, lookups):
+    extractors = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        lookup = prefix + field.source.replace('.', '__')
+
+        if isinstance(field, serializers.BaseSerializer):
+            nested = _compile_fields(field, lookup + '__', lookups)
+            if nested is None:
+                return None
+            extractors.append((name, _nested_extractor(nested)))
+        elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            lookups.append(lookup)
+            extractors.append((name, _passthrough_extractor(lookup)))
+        elif isinstance(field, PASSTHROUGH_FIELDS):
+            lookups.append(lookup)
+            extractors.append((name, _passthrough_extractor(lookup)))
+        elif isinstance(field, (serializers.DateTimeField, serializers.DateField,
+                                serializers.DecimalField, serializers.FloatField, ConvertedField)):
+            lookups.append(lookup)
+            extractors.append((name, _converting_extractor(lookup, field.to_representation)))
+        else:
+            return None
+    return extractors
+
+
+def _passthrough_extractor(lookup):
+    def extract(row):
+        return row[lookup]
+    return extract
+
+
+def _converting_extractor(lookup, convert):
+    def extract(row):
+        value = row[lookup]
+        return None if value is None else convert(value)
+    return extract
+
+
+def _nested_extractor(extractors):
+    def extract(row):
+        return {name: nested(row) for name, nested in extractors}
+    return extract
+
+
+@lru_cache(maxsize=None)
+def get_row_serializer(serializer_class):
+    """
+    Compile `serializer_class` into a ValuesRowSerializer.
+    @param serializer_class: DRF serializer class
+    @return: ValuesRowSerializer, or None if a field cannot be compiled
+    """
+    lookups = []
+    extractors = _compile_fields(serializer_class(), '', lookups)
+    if extractors is None:
+        return None
+    return ValuesRowSerializer(lookups, extractors)
+
+
+class FastListModelMixin:
+    """
+    ListAPIView mixin serving the list through the ValuesRowSerializer
+    compiled from `serializer_class`. Falls back to the regular DRF list
+    when the serializer or the queryset is not supported.
+    """
+
+    def get_row_serializer(self):
+        return get_row_serializer(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        row_serializer = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        if row_serializer is None or not isinstance(queryset, QuerySet):
+            return super().list(request, *args, **kwargs)
+
+        # Cursor pagination reads its position from the ordering fields, so
+        # they have to be part of every row.
+        extra_lookups = []
+        if isinstance(self.paginator, CursorPagination):
+            extra_lookups = [field.lstrip('-') for field in self.paginator.get_ordering(request, queryset, self)]
+        rows = row_serializer.values(queryset, *extra_lookups)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.many(page))
+        return Response(row_serializer.many(rows))
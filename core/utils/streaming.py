@@ -0,0 +1,63 @@
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from core.utils.renderers import FastJSONRenderer
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def iter_ndjson(rows, to_representation, chunk_size):
+    """
+    Encode rows as NDJSON, yielding one bytes chunk per `chunk_size` rows.
+    @param rows: iterable of rows, e.g. a QuerySet.iterator()
+    @param to_representation: callable turning a row into a JSON-able dict
+    @param chunk_size: rows per yielded chunk
+    """
+    render = FastJSONRenderer().render
+    lines = []
+    for row in rows:
+        lines.append(render(to_representation(row)))
+        if len(lines) >= chunk_size:
+            yield b'\n'.join(lines) + b'\n'
+            lines = []
+    if lines:
+        yield b'\n'.join(lines) + b'\n'
+
+
+async def iter_async(iterator):
+    """
+    Drive a synchronous iterator from the event loop. Every step runs in
+    the request's sync thread, so a database cursor keeps its connection.
+    """
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(iterator, None)) is not None:
+        yield chunk
+
+
+def streaming_response(request, chunks, content_type=NDJSON_CONTENT_TYPE):
+    """
+    Stream `chunks` under both WSGI and ASGI. ASGI needs an asynchronous
+    iterator, a synchronous one would be read into memory first.
+
+    The first chunk is pulled here, inside the view, so that a database
+    cursor behind `chunks` is opened while the replica picked for the
+    request and the MetricsMiddleware query wrapper are in place (both are
+    reset before the handler reads the rest), and so that a failing query
+    still gets the view's error response.
+    @param request: Django or DRF request
+    @param chunks: iterator of bytes
+    @return: StreamingHttpResponse
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    chunks = chain([first], chunks) if first is not None else iter(())
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = iter_async(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    # Proxies should pass chunks through as they come.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,14 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 
-# Create your views here.
+from core.utils.metrics import render_metrics
+
+
+def metrics(request):
+    """
+    Expose the per-view request metrics of this process in the Prometheus
+    text format. Only clients listed in METRICS_ALLOWED_IPS may scrape it.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
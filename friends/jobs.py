@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from core.utils.jobs import enqueue_many, register_job
+from friends.models import Friendship
+from friends.utils.suggestions import rank_friends_of_friends, store_suggestions
+
+
+@register_job
+def refresh_suggestions(user_id):
+    """
+    Re-rank the precomputed suggestions of a user whose friends changed,
+    the same way the precompute_suggestions command does.
+    """
+    # Read from the database, the worker's friend ID cache may be a local
+    # memory cache that the web processes cannot invalidate.
+    sample = list(Friendship.objects.filter(user_id=user_id).order_by('friend_id').values_list(
+        'friend_id', flat=True)[:settings.FRIEND_SUGGESTIONS_MAX_FRIENDS])
+    store_suggestions(user_id, rank_friends_of_friends(user_id, sample, settings.FRIEND_SUGGESTIONS_LIMIT))
+
+
+def schedule_suggestion_refresh(*user_ids):
+    """
+    Queue the refresh of the suggestions of the given users once the
+    current transaction commits. A refresh still queued for a user covers
+    the new one. One that was already claimed may have read the graph
+    before the commit, so the new one is queued after it.
+    """
+    enqueue_many(refresh_suggestions, [(user_id,) for user_id in user_ids], dedup=True, on_commit=True)
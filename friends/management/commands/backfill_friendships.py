@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from friends.models import FriendRequest, Friendship
+from friends.utils.friend_requests import invalidate_friendship
+
+
+class Command(BaseCommand):
+    help = "Backfill the Friendship adjacency table from accepted friend requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of accepted requests processed per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        accepted = FriendRequest.objects.filter(status='accepted').values_list(
+            'sender_id', 'receiver_id').order_by('id')
+
+        processed = 0
+        batch = []
+        for sender_id, receiver_id in accepted.iterator(chunk_size=batch_size):
+            batch.append(Friendship(user_id=sender_id, friend_id=receiver_id))
+            batch.append(Friendship(user_id=receiver_id, friend_id=sender_id))
+            if len(batch) >= batch_size * 2:
+                processed += self._flush(batch)
+                batch = []
+        if batch:
+            processed += self._flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {processed} friendships."))
+
+    def _flush(self, batch):
+        with transaction.atomic():
+            Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+        invalidate_friendship(*{friendship.user_id for friendship in batch})
+        return len(batch) // 2
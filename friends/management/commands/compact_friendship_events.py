@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from friends.models import FriendshipEvent
+
+
+class Command(BaseCommand):
+    help = "Delete friendship change feed events older than the retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.FRIEND_CHANGES_RETENTION_DAYS,
+                            help='Age in days after which events are deleted.')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of events deleted per query.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['retention_days'])
+        latest = FriendshipEvent.objects.order_by('-id').values_list('id', flat=True).first()
+        if latest is None:
+            self.stdout.write("No events to compact.")
+            return
+
+        # The newest event is always kept, the oldest remaining ID is what
+        # tells the changes endpoint which cursors have expired.
+        expired = FriendshipEvent.objects.filter(created_on__lt=cutoff, id__lt=latest).order_by('id')
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += FriendshipEvent.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} events older than {cutoff:%Y-%m-%d %H:%M}."))
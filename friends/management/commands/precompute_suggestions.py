@@ -0,0 +1,70 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from friends.models import FriendSuggestion
+from friends.utils.precompute import init_worker, load_adjacency, load_inactive, score_rows
+from friends.utils.suggestions import invalidate_suggestions
+
+
+class Command(BaseCommand):
+    help = ("Precompute the top friend suggestions of every user from the "
+            "friendship graph (friends of friends ranked by mutual friends) "
+            "into the FriendSuggestion table served by the suggestions endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=settings.FRIEND_SUGGESTIONS_LIMIT,
+                            help='Suggestions kept per user.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes scoring shards of users, 1 scores inline.')
+        parser.add_argument('--shard-size', type=int, default=2000,
+                            help='Consecutive user IDs scored and written per shard.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        adjacency = load_adjacency()
+        rows = adjacency.shape[0]
+        self.stdout.write(f"Loaded {adjacency.nnz // 2} friendships of up to {rows} users "
+                          f"in {time.monotonic() - started:.1f}s.")
+
+        shards = [(start, start + options['shard_size']) for start in range(0, rows, options['shard_size'])]
+        initargs = (adjacency, load_inactive(rows), settings.FRIEND_SUGGESTIONS_MAX_FRIENDS)
+        users = suggestions = 0
+        if options['workers'] > 1:
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker,
+                                     initargs=initargs) as executor:
+                futures = {executor.submit(score_rows, start, stop, options['top_k']): (start, stop)
+                           for start, stop in shards}
+                for future in as_completed(futures):
+                    written = self.write_shard(*futures[future], future.result())
+                    users, suggestions = users + written[0], suggestions + written[1]
+        else:
+            init_worker(*initargs)
+            for start, stop in shards:
+                written = self.write_shard(start, stop, score_rows(start, stop, options['top_k']))
+                users, suggestions = users + written[0], suggestions + written[1]
+
+        # Users above the last loaded row lost all their friends.
+        FriendSuggestion.objects.filter(user_id__gte=rows).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {suggestions} suggestions for {users} users in {time.monotonic() - started:.1f}s."))
+
+    def write_shard(self, start, stop, results):
+        """Replace the suggestions of the users in [start, stop)."""
+        rows = [
+            FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_friends=mutual, rank=rank)
+            for user_id, ranked in results
+            for rank, (candidate_id, mutual) in enumerate(ranked)
+        ]
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(user_id__gte=start, user_id__lt=stop).delete()
+            FriendSuggestion.objects.bulk_create(rows, batch_size=5000)
+        invalidate_suggestions(*[user_id for user_id, _ in results])
+        if self.verbosity > 1:
+            self.stdout.write(f"Users {start}-{stop - 1}: {len(rows)} suggestions.")
+        return len(results), len(rows)
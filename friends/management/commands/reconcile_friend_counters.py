@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from friends.utils.counters import reconcile_counters
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ("Recompute the friend and pending request counters of every user "
+            "from the friendship tables, and repair the ones that drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of users checked per query.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the users whose counters drifted.')
+
+    def handle(self, *args, **options):
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            batch = list(User.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1]
+            checked += len(batch)
+
+            user_ids = reconcile_counters(batch, dry_run=options['dry_run'])
+            repaired += len(user_ids)
+            if user_ids and options['verbosity'] > 1:
+                self.stdout.write(f"Drifted: {', '.join(map(str, user_ids))}")
+
+        action = "Found" if options['dry_run'] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users. {action} {repaired} with drifted counters."))
@@ -3,6 +3,7 @@ from django.conf import settings
 
 from core.models import AbstractUserBase, AbstractDateBase
 
+
 class FriendRequest(AbstractDateBase, AbstractUserBase):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -16,6 +17,140 @@ class FriendRequest(AbstractDateBase, AbstractUserBase):
 
     class Meta:
         unique_together = ('sender', 'receiver')
+        indexes = [
+            models.Index(fields=['receiver', 'status', 'created_on'], name='friendrequest_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender} -> {self.receiver} [{self.status}]"
+
+
+class FriendshipManager(models.Manager):
+    """
+    Maintains the symmetric friendship edges. Every friendship is stored
+    twice, once per direction, so lookups only ever filter on `user`.
+    """
+
+    def link(self, user_id, friend_id):
+        """Create both directions of a friendship, ignoring existing rows."""
+        self.bulk_create([
+            self.model(user_id=user_id, friend_id=friend_id),
+            self.model(user_id=friend_id, friend_id=user_id),
+        ], ignore_conflicts=True)
+
+    def link_many(self, user_id, friend_ids):
+        """Create both directions of a friendship with every ID in `friend_ids`."""
+        rows = []
+        for friend_id in friend_ids:
+            rows.append(self.model(user_id=user_id, friend_id=friend_id))
+            rows.append(self.model(user_id=friend_id, friend_id=user_id))
+        self.bulk_create(rows, ignore_conflicts=True)
+
+    def unlink(self, user_id, friend_id):
+        """Remove both directions of a friendship."""
+        self.filter(
+            models.Q(user_id=user_id, friend_id=friend_id) |
+            models.Q(user_id=friend_id, friend_id=user_id)
+        ).delete()
+
+    def friend_ids(self, user_id):
+        return self.filter(user_id=user_id).values_list('friend_id', flat=True)
+
+
+class Friendship(AbstractDateBase):
+    """
+    Denormalized adjacency table of accepted friend requests, with one row
+    per direction. Written together with the accepting FriendRequest.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='friendships', on_delete=models.CASCADE)
+    friend = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='reverse_friendships', on_delete=models.CASCADE)
+
+    objects = FriendshipManager()
+
+    class Meta:
+        unique_together = ('user', 'friend')
+
+    def __str__(self):
+        return f"{self.user} <-> {self.friend}"
+
+
+class FriendshipEventManager(models.Manager):
+
+    def record(self, action, actor_id, events):
+        """
+        Append an event to the change feed of both users involved. Must run
+        in the transaction making the change, so the feed never disagrees
+        with the friend requests.
+        @param action: 'sent', 'accepted' or 'rejected'
+        @param actor_id: ID of the user who acted
+        @param events: iterable of (target user ID, friend request ID)
+        """
+        self.record_many((action, actor_id, target_id, request_id) for target_id, request_id in events)
+
+    def record_many(self, events):
+        """
+        Append events of any action and actor with one insert, see `record`.
+        @param events: iterable of (action, actor ID, target user ID, friend request ID)
+        """
+        self.bulk_create([
+            self.model(user_id=owner_id, actor_id=actor_id, target_id=target_id,
+                       action=action, request_id=request_id)
+            for action, actor_id, target_id, request_id in events
+            for owner_id in (actor_id, target_id)
+        ])
+
+
+class FriendshipEvent(models.Model):
+    """
+    Append-only change log of friend requests, with one row per user whose
+    feed shows the event. The primary key is the feed's sequence number.
+    """
+    ACTION_CHOICES = (
+        ('sent', 'Sent'),
+        ('accepted', 'Accepted'),
+        ('rejected', 'Rejected'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='friendship_events', on_delete=models.CASCADE)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    target = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # Kept as a plain value, the event outlives the request.
+    request_id = models.BigIntegerField(null=True, blank=True)
+    created_on = models.DateTimeField(auto_now_add=True, db_index=True,
+                                      help_text='Date and time when the '
+                                                'entry was created')
+
+    objects = FriendshipEventManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='friendshipevent_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.actor_id} {self.action} {self.target_id}"
+
+
+class FriendSuggestion(models.Model):
+    """
+    Top friend candidates of a user, ranked by mutual friends and written
+    offline by the precompute_suggestions command.
+    """
+    # Rows are bulk written while users may be deleted; stale ones go away
+    # with the ORM cascade or the next run.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='precomputed_suggestions',
+                             on_delete=models.CASCADE, db_constraint=False)
+    candidate = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+',
+                                  on_delete=models.CASCADE, db_constraint=False)
+    mutual_friends = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    created_on = models.DateTimeField(auto_now_add=True,
+                                      help_text='Date and time when the '
+                                                'entry was created')
+
+    class Meta:
+        unique_together = ('user', 'rank')
 
     def __str__(self):
-        return f"{self.sender} -> {self.receiver} [{self.status}]"
\ No newline at end of file
+        return f"{self.user_id} #{self.rank}: {self.candidate_id} ({self.mutual_friends})"
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.utils.conditional import bump_versions, version_key
+from friends.models import FriendRequest
+
+
+@receiver([post_save, post_delete], sender=FriendRequest)
+def bump_friend_versions(sender, instance, **kwargs):
+    """Invalidate cached friend graph responses of both users once committed."""
+    user_ids = (instance.sender_id, instance.receiver_id)
+    transaction.on_commit(lambda: bump_versions(*[version_key('friends', user_id) for user_id in user_ids]))
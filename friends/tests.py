@@ -1,3 +1,448 @@
-from django.test import TestCase
+import json
+import random
+from array import array
+from collections import deque
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from friends.jobs import refresh_suggestions
+from friends.models import FriendRequest, Friendship, FriendshipEvent, FriendSuggestion
+from friends.utils.cache import (
+    friend_cache, friend_ids_cache_key, gallop_intersect_ids, get_friend_ids, intersect_ids, intersect_sorted_ids,
+    invalidate_friend_ids, pack_ids)
+from friends.utils.counters import reconcile_counters
+from friends.utils.friend_requests import (
+    RESULT_ACCEPTED, RESULT_ALREADY_FRIENDS, RESULT_ALREADY_SENT, RESULT_NOT_FOUND, RESULT_SELF, RESULT_SENT,
+    create_pending_requests, send_friend_requests)
+from friends.utils.graph import shortest_friend_path
+from friends.utils.suggestions import get_ranked_suggestions, rank_friends_of_friends, suggestions_cache_key
+from users.authentication import tokens_for_user
+from users.models import User
+
+
+class FriendGraphTestCase(TestCase):
+    """Creates users and authenticated requests against the friends API."""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.users = [User.objects.create_user(email=f'user{i}@example.com', name=f'User {i}')
+                      for i in range(6)]
+
+    def befriend(self, sender, receiver):
+        request = FriendRequest.objects.create(sender=sender, receiver=receiver, status='accepted')
+        Friendship.objects.link(sender.id, receiver.id)
+        return request
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(user).access_token}'}
+
+    def get(self, user, path, **extra):
+        return self.client.get(path, **self.auth(user), **extra)
+
+    def post(self, user, path, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, data, content_type='application/json', **self.auth(user))
+
+    def patch(self, user, path, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(path, data, content_type='application/json', **self.auth(user))
+
+
+class SendFriendRequestTests(FriendGraphTestCase):
+
+    def test_unknown_receiver_is_404(self):
+        response = self.post(self.users[0], '/friends/api/v1/send-request/', {'receiver': 999999})
+        self.assertEqual(response.status_code, 404)
+
+    def test_duplicate_request_is_rejected(self):
+        path = '/friends/api/v1/send-request/'
+        self.assertEqual(self.post(self.users[0], path, {'receiver': self.users[1].id}).status_code, 200)
+        self.assertEqual(self.post(self.users[0], path, {'receiver': self.users[1].id}).status_code, 400)
+
+    def test_reverse_pending_request_is_accepted(self):
+        a, b = self.users[:2]
+        self.post(b, '/friends/api/v1/send-request/', {'receiver': a.id})
+        response = self.post(a, '/friends/api/v1/send-request/', {'receiver': b.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['sender'], b.id)
+        self.assertEqual(list(FriendRequest.objects.values_list('sender_id', 'status')), [(b.id, 'accepted')])
+        self.assertEqual(Friendship.objects.count(), 2)
+        for user in (a, b):
+            user.refresh_from_db()
+            self.assertEqual((user.friends_count, user.pending_sent_count, user.pending_received_count), (1, 0, 0))
+        self.assertEqual(FriendshipEvent.objects.filter(user=a, action='accepted').count(), 1)
+        self.assertEqual(self.post(a, '/friends/api/v1/send-request/', {'receiver': b.id}).status_code, 400)
+
+    def test_bulk_send_reports_every_receiver(self):
+        a, b, c, d, e, _ = self.users
+        self.befriend(a, b)
+        FriendRequest.objects.create(sender=a, receiver=c)
+        FriendRequest.objects.create(sender=d, receiver=a)
+
+        results = dict(send_friend_requests(a.id, [b.id, c.id, d.id, e.id, a.id, 999999]))
+
+        self.assertEqual(results, {
+            b.id: RESULT_ALREADY_FRIENDS, c.id: RESULT_ALREADY_SENT, d.id: RESULT_ACCEPTED,
+            e.id: RESULT_SENT, a.id: RESULT_SELF, 999999: RESULT_NOT_FOUND,
+        })
+        self.assertEqual(FriendRequest.objects.get(sender=d, receiver=a).status, 'accepted')
+        self.assertTrue(Friendship.objects.filter(user=a, friend=d).exists())
+        self.assertTrue(FriendRequest.objects.filter(sender=a, receiver=e, status='pending').exists())
+
+    def test_insert_only_returns_its_own_rows(self):
+        a, b, c = self.users[:3]
+        FriendRequest.objects.create(sender=a, receiver=b)
+        created = create_pending_requests(a.id, [b.id, c.id])
+        self.assertEqual([receiver_id for receiver_id, _ in created], [c.id])
+
+
+class SuggestionTests(FriendGraphTestCase):
+
+    def test_refresh_job_invalidates_the_shared_ranking(self):
+        a, b, c, d = self.users[:4]
+        self.befriend(a, b)
+        self.befriend(b, c)
+        self.assertEqual(get_ranked_suggestions(a.id)[0], (c.id, 1))
+        self.assertIsNotNone(friend_cache().get(suggestions_cache_key(a.id)))
+
+        self.befriend(b, d)
+        refresh_suggestions(a.id)
+
+        self.assertIsNone(friend_cache().get(suggestions_cache_key(a.id)))
+        mutual = dict(get_ranked_suggestions(a.id))
+        self.assertEqual((mutual[c.id], mutual[d.id]), (1, 1))
+
+    def test_inactive_users_are_not_suggested(self):
+        a, b, c, d = self.users[:4]
+        self.befriend(a, b)
+        self.befriend(b, c)
+        self.befriend(b, d)
+        User.objects.filter(id=c.id).update(is_active=False)
+        self.assertNotIn(c.id, dict(rank_friends_of_friends(a.id, [b.id], 10)))
+
+        call_command('precompute_suggestions', workers=1, stdout=StringIO())
+        self.assertEqual(list(FriendSuggestion.objects.filter(user=a).values_list('candidate_id', flat=True)), [d.id])
+
+        # Deactivated after the run.
+        User.objects.filter(id=d.id).update(is_active=False)
+        friend_cache().delete(suggestions_cache_key(a.id))
+        self.assertNotIn(d.id, dict(get_ranked_suggestions(a.id)))
+
+    @override_settings(FRIEND_SUGGESTIONS_MAX_FRIENDS=3)
+    def test_precompute_matches_the_online_ranking(self):
+        users = self.users + [User.objects.create_user(email=f'extra{i}@example.com', name=f'Extra {i}')
+                              for i in range(24)]
+        rng = random.Random(5)
+        for _ in range(80):
+            first, second = rng.sample(users, 2)
+            if not Friendship.objects.filter(user=first, friend=second).exists():
+                self.befriend(first, second)
+        User.objects.filter(id__in=[user.id for user in rng.sample(users, 4)]).update(is_active=False)
+
+        call_command('precompute_suggestions', workers=1, top_k=4, shard_size=7, stdout=StringIO())
+
+        for user in users:
+            sample = list(Friendship.objects.filter(user=user).order_by('friend_id').values_list(
+                'friend_id', flat=True)[:3])
+            precomputed = list(FriendSuggestion.objects.filter(user=user).order_by('rank').values_list(
+                'candidate_id', 'mutual_friends'))
+            self.assertEqual(precomputed, rank_friends_of_friends(user.id, sample, 4))
+
+
+class CounterTests(FriendGraphTestCase):
+
+    def counters(self, user):
+        user.refresh_from_db()
+        return user.friends_count, user.pending_sent_count, user.pending_received_count
+
+    def test_transitions_update_both_users(self):
+        a, b = self.users[:2]
+        self.post(a, '/friends/api/v1/send-request/', {'receiver': b.id})
+        self.assertEqual((self.counters(a), self.counters(b)), ((0, 1, 0), (0, 0, 1)))
+
+        friend_request = FriendRequest.objects.get(sender=a, receiver=b)
+        path = f'/friends/api/v1/request/{friend_request.id}/respond/'
+        self.patch(b, path, {'status': 'accepted'})
+        self.assertEqual((self.counters(a), self.counters(b)), ((1, 0, 0), (1, 0, 0)))
+
+        self.patch(b, path, {'status': 'rejected'})
+        self.assertEqual((self.counters(a), self.counters(b)), ((0, 0, 0), (0, 0, 0)))
+
+    def test_repeated_response_is_applied_once(self):
+        a, b = self.users[:2]
+        friend_request = FriendRequest.objects.create(sender=b, receiver=a)
+        reconcile_counters([a.id, b.id])
+        path = f'/friends/api/v1/request/{friend_request.id}/respond/'
+        for _ in range(2):
+            self.assertEqual(self.patch(a, path, {'status': 'accepted'}).status_code, 200)
+        self.assertEqual((self.counters(a), self.counters(b)), ((1, 0, 0), (1, 0, 0)))
+        self.assertEqual(FriendshipEvent.objects.filter(action='accepted').count(), 2)
+
+    def test_bulk_respond_and_auto_accept(self):
+        a, b, c, d = self.users[:4]
+        for sender in (b, c, d):
+            FriendRequest.objects.create(sender=sender, receiver=a)
+        reconcile_counters([user.id for user in self.users])
+
+        self.patch(a, '/friends/api/v1/requests/respond/', {'senders': [b.id, c.id], 'status': 'accepted'})
+        self.assertEqual(self.counters(a), (2, 0, 1))
+        self.post(a, '/friends/api/v1/send-requests/', {'receivers': [d.id]})
+        self.assertEqual((self.counters(a), self.counters(d)), ((3, 0, 0), (1, 0, 0)))
+
+    def test_reconcile_repairs_drift(self):
+        a, b = self.users[:2]
+        self.befriend(a, b)
+        User.objects.filter(id=b.id).update(friends_count=7)
+        self.assertEqual(sorted(reconcile_counters([a.id, b.id])), [a.id, b.id])
+        self.assertEqual((self.counters(a), self.counters(b)), ((1, 0, 0), (1, 0, 0)))
+        self.assertEqual(reconcile_counters([a.id, b.id]), [])
+
+
+class RespondFriendRequestTests(FriendGraphTestCase):
+    path = '/friends/api/v1/requests/respond/'
+
+    def test_bulk_accept_changes_only_own_pending_requests(self):
+        a, b, c, d, e, _ = self.users
+        mine = FriendRequest.objects.create(sender=b, receiver=a)
+        rejected = FriendRequest.objects.create(sender=c, receiver=a, status='rejected')
+        other = FriendRequest.objects.create(sender=d, receiver=e)
+
+        response = self.patch(a, self.path, {'ids': [mine.id, rejected.id, other.id], 'status': 'accepted'})
+        self.assertEqual(response.json()['data']['updated'], [mine.id])
+        self.assertEqual(FriendRequest.objects.get(id=rejected.id).status, 'rejected')
+        self.assertEqual(FriendRequest.objects.get(id=other.id).status, 'pending')
+        self.assertEqual(set(Friendship.objects.values_list('user_id', 'friend_id')), {(a.id, b.id), (b.id, a.id)})
+        self.assertTrue(FriendshipEvent.objects.filter(user=b, actor=a, action='accepted').exists())
+
+        response = self.patch(a, self.path, {'ids': [mine.id], 'status': 'accepted'})
+        self.assertEqual(response.json()['data']['updated'], [])
+
+    def test_bulk_reject_by_sender(self):
+        a, b, c = self.users[:3]
+        FriendRequest.objects.create(sender=b, receiver=a)
+        kept = FriendRequest.objects.create(sender=c, receiver=a)
+
+        self.patch(a, self.path, {'senders': [b.id], 'status': 'rejected'})
+        self.assertEqual(FriendRequest.objects.get(sender=b, receiver=a).status, 'rejected')
+        self.assertEqual(FriendRequest.objects.get(id=kept.id).status, 'pending')
+        self.assertFalse(Friendship.objects.exists())
+
+    def test_ids_or_senders_are_required(self):
+        response = self.patch(self.users[0], self.path, {'status': 'accepted'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FriendCacheTests(FriendGraphTestCase):
+
+    def friend_list(self, user, **extra):
+        return self.get(user, '/friends/api/v1/list/', **extra)
+
+    def test_accept_invalidates_both_friend_lists(self):
+        a, b, c = self.users[:3]
+        self.befriend(a, c)
+        self.assertEqual(list(get_friend_ids(a.id)), [c.id])
+        self.assertEqual(list(get_friend_ids(b.id)), [])
+        etag = self.friend_list(a)['ETag']
+
+        friend_request = FriendRequest.objects.create(sender=b, receiver=a)
+        self.patch(a, f'/friends/api/v1/request/{friend_request.id}/respond/', {'status': 'accepted'})
+
+        self.assertIsNone(friend_cache().get(friend_ids_cache_key(a.id)))
+        self.assertEqual(list(get_friend_ids(a.id)), sorted([b.id, c.id]))
+        self.assertEqual(list(get_friend_ids(b.id)), [a.id])
+        response = self.friend_list(a, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({friend['id'] for friend in response.json()['data']['results']}, {b.id, c.id})
+
+    def test_invalidation_during_a_load_wins(self):
+        a, b = self.users[:2]
+
+        def link_then_pack(ids):
+            # Another process links the users after this load read the
+            # database, and invalidates before the stale write-back.
+            Friendship.objects.link(a.id, b.id)
+            invalidate_friend_ids(a.id, b.id)
+            return pack_ids(ids)
+
+        with mock.patch('friends.utils.cache.pack_ids', side_effect=link_then_pack):
+            self.assertEqual(list(get_friend_ids(a.id)), [])
+
+        self.assertEqual(list(get_friend_ids(a.id)), [b.id])
+
+    def test_reject_of_accepted_request_unlinks(self):
+        a, b = self.users[:2]
+        friend_request = self.befriend(b, a)
+        self.assertEqual(list(get_friend_ids(a.id)), [b.id])
+        self.patch(a, f'/friends/api/v1/request/{friend_request.id}/respond/', {'status': 'rejected'})
+        self.assertEqual(list(get_friend_ids(a.id)), [])
+        self.assertEqual(list(get_friend_ids(b.id)), [])
+
+
+@override_settings(FRIEND_CHANGES_SETTLE_SECONDS=0)
+class FriendshipChangesTests(FriendGraphTestCase):
+    path = '/friends/api/v1/changes/'
+
+    def changes(self, user, **params):
+        return self.client.get(self.path, params, **self.auth(user))
+
+    def test_cursor_returns_each_event_once_in_order(self):
+        a, b, c = self.users[:3]
+        cursor = self.changes(a).json()['data']['cursor']
+
+        self.post(b, '/friends/api/v1/send-request/', {'receiver': a.id})
+        friend_request = FriendRequest.objects.get(sender=b, receiver=a)
+        self.patch(a, f'/friends/api/v1/request/{friend_request.id}/respond/', {'status': 'accepted'})
+        self.post(c, '/friends/api/v1/send-request/', {'receiver': b.id})
+
+        with self.settings(FRIEND_CHANGES_PAGE_SIZE=1):
+            first = self.changes(a, since=cursor).json()['data']
+            self.assertTrue(first['has_more'])
+            second = self.changes(a, since=first['cursor']).json()['data']
+        self.assertFalse(second['has_more'])
+        self.assertEqual([(event['actor'], event['action']) for event in first['events'] + second['events']],
+                         [(b.id, 'sent'), (a.id, 'accepted')])
+
+        again = self.changes(a, since=second['cursor']).json()['data']
+        self.assertEqual((again['events'], again['cursor']), ([], second['cursor']))
+
+    def test_compacted_cursor_is_gone(self):
+        a, b, c = self.users[:3]
+        cursor = self.changes(a).json()['data']['cursor']
+        self.post(b, '/friends/api/v1/send-request/', {'receiver': a.id})
+        self.post(c, '/friends/api/v1/send-request/', {'receiver': a.id})
+        FriendshipEvent.objects.update(created_on=timezone.now() - timedelta(days=60))
+
+        call_command('compact_friendship_events', stdout=StringIO())
+
+        self.assertEqual(self.changes(a, since=cursor).status_code, 410)
+        latest = FriendshipEvent.objects.get()
+        self.assertEqual(self.changes(a, since=latest.id).status_code, 200)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.changes(self.users[0], since='abc').status_code, 400)
+        self.assertEqual(self.changes(self.users[0], since=-1).status_code, 400)
+
+
+class MutualFriendTests(FriendGraphTestCase):
+
+    def test_intersections_match_set_intersection(self):
+        rng = random.Random(7)
+        for small_size, large_size in ((0, 50), (40, 60), (5, 2000), (3, 100000)):
+            small = array('q', sorted(rng.sample(range(3 * large_size + 10), small_size)))
+            large = array('q', sorted(rng.sample(range(3 * large_size + 10), large_size)))
+            expected = sorted(set(small) & set(large))
+            self.assertEqual(intersect_ids(small, large), expected)
+            self.assertEqual(gallop_intersect_ids(small, large), expected)
+            self.assertEqual(intersect_sorted_ids(large, small), expected)
+
+    def test_mutual_friends_and_counts(self):
+        a, b, c, d, e, f = self.users
+        for friend in (c, d, e):
+            self.befriend(a, friend)
+        for friend in (c, e, f):
+            self.befriend(friend, b)
+
+        response = self.get(a, f'/friends/api/v1/mutual/{b.id}/')
+        self.assertEqual([user['id'] for user in response.json()['data']['results']], [c.id, e.id])
+        self.assertEqual(response.json()['data']['count'], 2)
+
+        response = self.get(a, '/friends/api/v1/mutual/counts/', data={'users': f'{b.id},{f.id},{c.id}'})
+        self.assertEqual({row['user']: row['mutual_friends'] for row in response.json()['data']},
+                         {b.id: 2, f.id: 0, c.id: 0})
+
+    def test_counts_require_users(self):
+        self.assertEqual(self.get(self.users[0], '/friends/api/v1/mutual/counts/').status_code, 400)
+
+
+class StreamFriendsTests(FriendGraphTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.me = self.users[0]
+        for friend in self.users[1:]:
+            self.befriend(self.me, friend)
+        self.expected = [user.id for user in self.users[1:]]
+
+    def test_query_runs_inside_the_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(self.me, '/friends/api/v1/list/stream/', data={'chunk_size': 2})
+            # Opened before the response is returned, on the request's
+            # database alias and under the metrics wrapper.
+            self.assertTrue(any('friends_friendship' in query['sql'] for query in queries.captured_queries))
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], self.expected)
+
+    async def test_asgi_streams_asynchronously(self):
+        token = tokens_for_user(self.me).access_token
+        response = await self.async_client.get('/friends/api/v1/list/stream/', {'chunk_size': 2},
+                                               headers={'Authorization': f'Bearer {token}'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], self.expected)
+
+
+class FriendPathTests(FriendGraphTestCase):
+
+    def distances(self, adjacency, source):
+        """Reference single-source BFS."""
+        distances, queue = {source: 0}, deque([source])
+        while queue:
+            node = queue.popleft()
+            for friend in adjacency[node]:
+                if friend not in distances:
+                    distances[friend] = distances[node] + 1
+                    queue.append(friend)
+        return distances
+
+    def test_paths_are_shortest_on_a_random_graph(self):
+        users = self.users + [User.objects.create_user(email=f'extra{i}@example.com', name=f'Extra {i}')
+                              for i in range(24)]
+        rng = random.Random(3)
+        adjacency = {user.id: set() for user in users}
+        for _ in range(30):
+            first, second = rng.sample(users, 2)
+            if second.id not in adjacency[first.id]:
+                self.befriend(first, second)
+                adjacency[first.id].add(second.id)
+                adjacency[second.id].add(first.id)
+
+        source = users[0].id
+        distances = self.distances(adjacency, source)
+        for user in users:
+            path, truncated = shortest_friend_path(source, user.id, len(users), 10000)
+            self.assertFalse(truncated)
+            if user.id not in distances:
+                self.assertIsNone(path)
+                continue
+            self.assertEqual(len(path) - 1, distances[user.id])
+            self.assertEqual((path[0], path[-1]), (source, user.id))
+            for node, friend in zip(path, path[1:]):
+                self.assertIn(friend, adjacency[node])
+
+    def test_endpoint_reports_degrees_and_limits(self):
+        a, b, c, d, e, _ = self.users
+        for first, second in ((a, b), (b, c), (c, d), (d, e)):
+            self.befriend(first, second)
+
+        data = self.get(a, f'/friends/api/v1/path/{e.id}/').json()['data']
+        self.assertEqual(data['degrees'], 4)
+        self.assertEqual([user['id'] for user in data['path']], [a.id, b.id, c.id, d.id, e.id])
+        data = self.get(a, f'/friends/api/v1/path/{e.id}/', data={'max_depth': 3}).json()['data']
+        self.assertEqual((data['degrees'], data['path']), (None, []))
+        self.assertEqual(self.get(a, f'/friends/api/v1/path/{e.id}/', data={'max_depth': 0}).status_code, 400)
+
+        _, truncated = shortest_friend_path(a.id, e.id, 6, 3)
+        self.assertTrue(truncated)
@@ -0,0 +1,164 @@
+import secrets
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from friends.models import Friendship
+
+
+# Size ratio above which intersections gallop instead of merging.
+GALLOP_RATIO = 16
+
+
+def friend_cache():
+    return caches[settings.FRIEND_CACHE_ALIAS]
+
+
+def friend_ids_cache_key(user_id):
+    return f"friend-ids:{user_id}"
+
+
+def friend_ids_generation_key(user_id):
+    return f"friend-ids-generation:{user_id}"
+
+
+def pack_ids(ids):
+    """Pack user IDs into a compact, sorted array of 64-bit integers."""
+    return array('q', sorted(ids)).tobytes()
+
+
+def unpack_ids(data):
+    ids = array('q')
+    ids.frombytes(data)
+    return ids
+
+
+def get_many_friend_ids(user_ids):
+    """
+    Return a dict mapping each user ID to the sorted array of its friend IDs.
+    Cache misses are loaded together in a single query and written back.
+
+    Every load stamps the users it loads with a new generation before
+    reading the database, and its entries are only used while that
+    generation is current. An invalidation that lands during a load drops
+    the generation, so the entry written back from the older read is
+    ignored instead of being served until it expires.
+    @param user_ids: iterable of user IDs
+    @return: dict of user ID -> array('q')
+    """
+    user_ids = list(user_ids)
+    cache = friend_cache()
+    keys = {friend_ids_cache_key(user_id): user_id for user_id in user_ids}
+    generation_keys = {user_id: friend_ids_generation_key(user_id) for user_id in user_ids}
+    cached = cache.get_many([*keys, *generation_keys.values()])
+    result = {}
+    for key, user_id in keys.items():
+        entry = cached.get(key)
+        if entry is not None and entry[0] == cached.get(generation_keys[user_id]):
+            result[user_id] = unpack_ids(entry[1])
+
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if missing:
+        generation = secrets.token_hex(8)
+        cache.set_many({generation_keys[user_id]: generation for user_id in missing},
+                       settings.FRIEND_IDS_CACHE_TIMEOUT)
+        loaded = {user_id: [] for user_id in missing}
+        # Misses follow an invalidation after a write, which a lagging
+        # replica may not have yet.
+        for user_id, friend_id in Friendship.objects.using(DEFAULT_DB_ALIAS).filter(
+                user_id__in=missing).values_list('user_id', 'friend_id'):
+            loaded[user_id].append(friend_id)
+        packed = {user_id: pack_ids(ids) for user_id, ids in loaded.items()}
+        cache.set_many({friend_ids_cache_key(user_id): (generation, data) for user_id, data in packed.items()},
+                       settings.FRIEND_IDS_CACHE_TIMEOUT)
+        result.update({user_id: unpack_ids(data) for user_id, data in packed.items()})
+    return result
+
+
+def get_friend_ids(user_id):
+    """Return the sorted array of friend IDs of `user_id`."""
+    return get_many_friend_ids([user_id])[user_id]
+
+
+def invalidate_friend_ids(*user_ids):
+    friend_cache().delete_many([key for user_id in user_ids
+                                for key in (friend_ids_cache_key(user_id), friend_ids_generation_key(user_id))])
+
+
+def contains_id(ids, value):
+    """Binary search for `value` in a sorted array of IDs."""
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def is_friend(user_id, other_id):
+    return contains_id(get_friend_ids(user_id), other_id)
+
+
+def intersect_ids(left, right):
+    """Merge-intersect two sorted arrays of IDs."""
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] == right[j]:
+            result.append(left[i])
+            i += 1
+            j += 1
+        elif left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def gallop_intersect_ids(small, large):
+    """
+    Intersect a short sorted array of IDs with a much longer one, probing
+    `large` with exponentially growing steps and then a binary search, in
+    O(len(small) * log(len(large))).
+    """
+    result = []
+    low, size = 0, len(large)
+    for value in small:
+        bound = 1
+        while low + bound < size and large[low + bound] < value:
+            bound *= 2
+        low = bisect_left(large, value, low + bound // 2, min(low + bound + 1, size))
+        if low == size:
+            break
+        if large[low] == value:
+            result.append(value)
+            low += 1
+    return result
+
+
+def intersect_sorted_ids(left, right):
+    """
+    Intersect two sorted arrays of IDs, merging arrays of similar size and
+    galloping through the larger one when degrees are skewed.
+    """
+    if len(left) > len(right):
+        left, right = right, left
+    if len(left) * GALLOP_RATIO < len(right):
+        return gallop_intersect_ids(left, right)
+    return intersect_ids(left, right)
+
+
+def mutual_friend_ids(user_id, other_id):
+    """Return the sorted IDs of the friends `user_id` and `other_id` share."""
+    friend_ids = get_many_friend_ids([user_id, other_id])
+    return intersect_sorted_ids(friend_ids[user_id], friend_ids[other_id])
+
+
+def count_mutual_friends(user_id, other_ids):
+    """
+    Count the friends `user_id` shares with each of `other_ids`, loading
+    every friend list in one cache round trip.
+    @return: dict of other ID -> number of mutual friends
+    """
+    friend_ids = get_many_friend_ids([user_id, *other_ids])
+    mine = friend_ids[user_id]
+    return {other_id: len(intersect_sorted_ids(mine, friend_ids[other_id])) for other_id in other_ids}
@@ -0,0 +1,109 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from core.utils.conditional import bump_versions, version_key
+from friends.models import FriendRequest, Friendship
+from users.models import User
+
+
+FRIENDS = 'friends_count'
+PENDING_RECEIVED = 'pending_received_count'
+PENDING_SENT = 'pending_sent_count'
+COUNTER_FIELDS = (FRIENDS, PENDING_RECEIVED, PENDING_SENT)
+
+
+class CounterDeltas:
+    """
+    Collects the changes friend request transitions make to the counters
+    on User, to apply them with a single UPDATE in the same transaction.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(Counter)
+
+    def transition(self, sender_id, receiver_id, previous, new):
+        """
+        Record a friend request going from status `previous` to `new`,
+        None standing for a request that does not exist.
+        """
+        if previous == new:
+            return
+        for status, sign in ((previous, -1), (new, 1)):
+            if status == 'pending':
+                self.deltas[PENDING_SENT][sender_id] += sign
+                self.deltas[PENDING_RECEIVED][receiver_id] += sign
+            elif status == 'accepted':
+                self.deltas[FRIENDS][sender_id] += sign
+                self.deltas[FRIENDS][receiver_id] += sign
+
+    def apply(self):
+        """
+        Update every touched user with one statement, so concurrent
+        transactions lock the rows in the same order. Counters are clamped
+        at zero, drift is left to reconcile_counters.
+        """
+        updates = {}
+        user_ids = set()
+        for field, deltas in self.deltas.items():
+            deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+            if not deltas:
+                continue
+            user_ids.update(deltas)
+            change = Case(*[When(id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+                          default=Value(0), output_field=IntegerField())
+            updates[field] = Greatest(F(field) + change, Value(0))
+        if not updates:
+            return
+
+        User.objects.filter(id__in=user_ids).update(**updates)
+        # update() skips the signals bumping the profile versions. The user
+        # list is not invalidated, it catches up when 'user-counters' expires.
+        keys = [version_key('user', user_id) for user_id in user_ids]
+        transaction.on_commit(lambda: bump_versions(*keys))
+
+
+def count_subquery(queryset, field):
+    """Correlated COUNT(*) of `queryset` rows whose `field` is the outer user."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            total=Count('*')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def actual_counters():
+    """Expressions recounting every counter of a user from the friendship tables."""
+    pending = FriendRequest.objects.filter(status='pending')
+    return {
+        FRIENDS: count_subquery(Friendship.objects.all(), 'user'),
+        PENDING_RECEIVED: count_subquery(pending, 'receiver'),
+        PENDING_SENT: count_subquery(pending, 'sender'),
+    }
+
+
+def reconcile_counters(user_ids, dry_run=False):
+    """
+    Recount the counters of the given users and repair the ones that
+    drifted, e.g. after a bulk load that bypassed CounterDeltas. The
+    repairing UPDATE recounts by itself, so changes committed since the
+    check are not overwritten with stale values.
+    @param user_ids: IDs of the users to check, batched by the caller
+    @param dry_run: only report the drifted users
+    @return: IDs of the users whose counters drifted
+    """
+    actual = actual_counters()
+    drifted = Q()
+    for field in COUNTER_FIELDS:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    drifted_ids = list(User.objects.filter(id__in=user_ids).annotate(
+        **{f'actual_{field}': expression for field, expression in actual.items()}
+    ).filter(drifted).values_list('id', flat=True))
+
+    if drifted_ids and not dry_run:
+        User.objects.filter(id__in=drifted_ids).update(**actual)
+        keys = [version_key('user', user_id) for user_id in drifted_ids]
+        transaction.on_commit(lambda: bump_versions(*keys))
+    return drifted_ids
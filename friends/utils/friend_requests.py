@@ -0,0 +1,174 @@
+from django.db import connections, router, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from core.utils.conditional import bump_versions, version_key
+from friends.jobs import schedule_suggestion_refresh
+from friends.models import FriendRequest, Friendship, FriendshipEvent
+from friends.utils.cache import contains_id, get_friend_ids, invalidate_friend_ids
+from friends.utils.counters import CounterDeltas
+from friends.utils.suggestions import invalidate_suggestions
+from users.models import User
+
+
+RESULT_SENT = 'sent'
+RESULT_ACCEPTED = 'accepted'
+RESULT_ALREADY_SENT = 'already_sent'
+RESULT_ALREADY_FRIENDS = 'already_friends'
+RESULT_NOT_FOUND = 'not_found'
+RESULT_SELF = 'self'
+
+
+def invalidate_friendship(*user_ids):
+    """Drop every cached view of the friend graph for the given users."""
+    invalidate_friend_ids(*user_ids)
+    invalidate_suggestions(*user_ids)
+    bump_versions(*[version_key('friends', user_id) for user_id in user_ids])
+
+
+def create_pending_requests(sender_id, receiver_ids):
+    """
+    Insert pending friend requests with one statement, skipping the pairs
+    that already have a request, e.g. one sent by a concurrent request.
+    @param sender_id: ID of the sending user
+    @param receiver_ids: list of receiver user IDs
+    @return: list of (receiver_id, request_id) of the rows inserted here
+    """
+    connection = connections[router.db_for_write(FriendRequest)]
+    opts = FriendRequest._meta
+    quote = connection.ops.quote_name
+    now = opts.get_field('created_on').get_db_prep_value(timezone.now(), connection)
+    columns = ', '.join(quote(opts.get_field(name).column)
+                        for name in ('sender', 'receiver', 'status', 'created_on', 'modified_on'))
+    params = [value for receiver_id in receiver_ids for value in (sender_id, receiver_id, 'pending', now, now)]
+    # Unlike bulk_create(ignore_conflicts=True), RETURNING only reports the
+    # rows this statement inserted (PostgreSQL, SQLite 3.35+).
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(opts.db_table)} ({columns}) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(receiver_ids))} "
+            f"ON CONFLICT DO NOTHING "
+            f"RETURNING {quote(opts.get_field('receiver').column)}, {quote(opts.pk.column)}",
+            params,
+        )
+        return cursor.fetchall()
+
+
+def send_friend_requests(sender_id, receiver_ids):
+    """
+    Send friend requests from one user to many receivers.
+
+    All receivers are validated in a single query that also fetches any
+    request already exchanged with the sender in either direction. A pending
+    request from a receiver to the sender is accepted instead of sending a
+    new one, the remaining requests are inserted with one bulk insert.
+    Both are appended to the friendship change feed and counted on the
+    users in the same transaction.
+    @param sender_id: ID of the sending user
+    @param receiver_ids: list of receiver user IDs
+    @return: list of (receiver_id, result) tuples in request order
+    """
+    receiver_ids = list(dict.fromkeys(receiver_ids))
+    results = {}
+
+    candidates = [receiver_id for receiver_id in receiver_ids if receiver_id != sender_id]
+    for receiver_id in receiver_ids:
+        if receiver_id == sender_id:
+            results[receiver_id] = RESULT_SELF
+
+    rows = User.objects.filter(id__in=candidates, is_active=True).annotate(
+        outgoing=Subquery(FriendRequest.objects.filter(
+            sender_id=sender_id, receiver_id=OuterRef('pk')).values('status')[:1]),
+        incoming=Subquery(FriendRequest.objects.filter(
+            sender_id=OuterRef('pk'), receiver_id=sender_id).values('status')[:1]),
+    ).values_list('id', 'outgoing', 'incoming')
+
+    friend_ids = get_friend_ids(sender_id)
+    to_send, to_accept = [], []
+    for receiver_id, outgoing, incoming in rows:
+        if contains_id(friend_ids, receiver_id) or 'accepted' in (outgoing, incoming):
+            results[receiver_id] = RESULT_ALREADY_FRIENDS
+        elif incoming == 'pending':
+            to_accept.append(receiver_id)
+            results[receiver_id] = RESULT_ACCEPTED
+        elif outgoing is not None:
+            results[receiver_id] = RESULT_ALREADY_SENT
+        else:
+            to_send.append(receiver_id)
+            results[receiver_id] = RESULT_SENT
+
+    counters = CounterDeltas()
+    with transaction.atomic():
+        if to_accept:
+            # Only the requests still pending once locked are accepted, the
+            # classification above read them without a lock.
+            accepted = list(FriendRequest.objects.filter(
+                sender_id__in=to_accept, receiver_id=sender_id, status='pending'
+            ).select_for_update().values_list('sender_id', 'id'))
+            requester_ids = [requester_id for requester_id, _ in accepted]
+            FriendRequest.objects.filter(
+                id__in=[request_id for _, request_id in accepted]
+            ).update(status='accepted', modified_on=timezone.now())
+            Friendship.objects.link_many(sender_id, requester_ids)
+            FriendshipEvent.objects.record('accepted', sender_id, accepted)
+            for requester_id in requester_ids:
+                counters.transition(requester_id, sender_id, 'pending', 'accepted')
+            transaction.on_commit(lambda: invalidate_friendship(sender_id, *requester_ids))
+            schedule_suggestion_refresh(sender_id, *requester_ids)
+            # Requests withdrawn or answered in the meantime fall back to sending one.
+            to_send.extend(receiver_id for receiver_id in to_accept if receiver_id not in set(requester_ids))
+        if to_send:
+            sent = create_pending_requests(sender_id, to_send)
+            for receiver_id in set(to_send) - {receiver_id for receiver_id, _ in sent}:
+                results[receiver_id] = RESULT_ALREADY_SENT
+            for receiver_id, _ in sent:
+                results[receiver_id] = RESULT_SENT
+            FriendshipEvent.objects.record('sent', sender_id, sent)
+            for receiver_id, _ in sent:
+                counters.transition(sender_id, receiver_id, None, 'pending')
+        counters.apply()
+
+    return [(receiver_id, results.get(receiver_id, RESULT_NOT_FOUND)) for receiver_id in receiver_ids]
+
+
+def respond_to_friend_requests(receiver_id, status, request_ids=None, sender_ids=None):
+    """
+    Accept or reject many pending friend requests received by a user.
+
+    The matching requests are locked and then changed with a single
+    filtered UPDATE. Accepted friendships, the change feed events and the
+    user counters are written in the same transaction.
+    @param receiver_id: ID of the user who received the requests
+    @param status: 'accepted' or 'rejected'
+    @param request_ids: optional list of friend request IDs
+    @param sender_ids: optional list of sender user IDs
+    @return: sorted list of the friend request IDs that changed
+    """
+    with transaction.atomic():
+        pending = FriendRequest.objects.filter(receiver_id=receiver_id, status='pending')
+        if request_ids is not None:
+            pending = pending.filter(id__in=request_ids)
+        if sender_ids is not None:
+            pending = pending.filter(sender_id__in=sender_ids)
+
+        changed = dict(pending.select_for_update().values_list('id', 'sender_id'))
+        if not changed:
+            return []
+
+        FriendRequest.objects.filter(
+            id__in=list(changed), receiver_id=receiver_id, status='pending'
+        ).update(status=status, modified_on=timezone.now())
+
+        if status == 'accepted':
+            senders = list(changed.values())
+            Friendship.objects.link_many(receiver_id, senders)
+            transaction.on_commit(lambda: invalidate_friendship(receiver_id, *senders))
+            schedule_suggestion_refresh(receiver_id, *senders)
+        FriendshipEvent.objects.record(
+            status, receiver_id, [(sender_id, request_id) for request_id, sender_id in changed.items()])
+        counters = CounterDeltas()
+        for sender_id in changed.values():
+            counters.transition(sender_id, receiver_id, 'pending', status)
+        counters.apply()
+
+    return sorted(changed)
@@ -0,0 +1,77 @@
+from friends.utils.cache import get_many_friend_ids
+
+
+# Friend lists loaded per cache round trip / query while expanding a level.
+ADJACENCY_BATCH_SIZE = 1000
+
+
+class SearchSide:
+    """One direction of the bidirectional search."""
+
+    def __init__(self, root):
+        self.parents = {root: None}
+        self.depths = {root: 0}
+        self.frontier = [root]
+
+    def path_to(self, node):
+        """Nodes from `node` back to this side's root."""
+        path = []
+        while node is not None:
+            path.append(node)
+            node = self.parents[node]
+        return path
+
+
+def shortest_friend_path(source_id, target_id, max_depth, max_visited):
+    """
+    Find a shortest chain of friendships between two users with a
+    bidirectional breadth-first search. Each step expands the smaller
+    frontier by one level, loading the friend lists of the whole level in
+    batches from the friend ID cache.
+    @param source_id: ID of the first user
+    @param target_id: ID of the second user
+    @param max_depth: longest path, in friendships, to look for
+    @param max_visited: number of users the search may discover
+    @return: (path, truncated) where path is the list of user IDs from
+             source to target, or None when no path was found, and truncated
+             tells whether the visited cap stopped the search early, in
+             which case a returned path may not be the shortest
+    """
+    if source_id == target_id:
+        return [source_id], False
+
+    forward, backward = SearchSide(source_id), SearchSide(target_id)
+    visited = 2
+    depth = 0
+    while forward.frontier and backward.frontier and depth < max_depth:
+        side, other = (forward, backward) if len(forward.frontier) <= len(backward.frontier) else (backward, forward)
+        meetings = []
+        next_frontier = []
+        for start in range(0, len(side.frontier), ADJACENCY_BATCH_SIZE):
+            batch = side.frontier[start:start + ADJACENCY_BATCH_SIZE]
+            for node, friend_ids in get_many_friend_ids(batch).items():
+                node_depth = side.depths[node] + 1
+                for friend_id in friend_ids:
+                    if friend_id in side.parents:
+                        continue
+                    side.parents[friend_id] = node
+                    side.depths[friend_id] = node_depth
+                    next_frontier.append(friend_id)
+                    if friend_id in other.parents:
+                        meetings.append(friend_id)
+                    visited += 1
+                if visited > max_visited:
+                    break
+            if visited > max_visited:
+                break
+        depth += 1
+
+        if visited > max_visited and not meetings:
+            return None, True
+        if meetings:
+            # Meetings of one level can differ in depth on the other side.
+            meeting = min(meetings, key=lambda node: other.depths[node])
+            path = forward.path_to(meeting)[::-1] + backward.path_to(meeting)[1:]
+            return path, visited > max_visited
+        side.frontier = next_frontier
+    return None, False
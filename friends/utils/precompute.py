@@ -0,0 +1,98 @@
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from friends.models import Friendship
+from users.models import User
+
+
+# Adjacency of the worker process, set by `init_worker()`.
+_graph = {}
+
+
+def load_adjacency(chunk_size=10000):
+    """
+    Load the friendship graph as a square compressed sparse row adjacency
+    matrix. User IDs index the rows and columns directly: the friends of
+    user `u` are adjacency.indices[indptr[u]:indptr[u + 1]], sorted.
+    @return: scipy.sparse CSR matrix
+    """
+    user_ids, friend_ids = array('q'), array('q')
+    edges = Friendship.objects.order_by('user_id', 'friend_id').values_list('user_id', 'friend_id')
+    for user_id, friend_id in edges.iterator(chunk_size=chunk_size):
+        user_ids.append(user_id)
+        friend_ids.append(friend_id)
+    rows, columns = np.frombuffer(user_ids, dtype=np.int64), np.frombuffer(friend_ids, dtype=np.int64)
+    size = int(max(rows.max(), columns.max())) + 1 if len(rows) else 0
+    adjacency = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=(size, size))
+    adjacency.sort_indices()
+    return adjacency
+
+
+def load_inactive(size):
+    """
+    Flag the inactive users among the first `size` user IDs, they are
+    never suggested.
+    @return: boolean array indexed by user ID
+    """
+    inactive = np.zeros(size, dtype=bool)
+    ids = np.fromiter(User.objects.filter(is_active=False, id__lt=size).values_list('id', flat=True), dtype=np.int64)
+    inactive[ids] = True
+    return inactive
+
+
+def sample_adjacency(adjacency, max_friends):
+    """
+    Keep the first `max_friends` friends of every row, the same bounded
+    sample of friends as the online ranking expands.
+    """
+    row_lengths = np.diff(adjacency.indptr)
+    positions = np.arange(adjacency.nnz) - np.repeat(adjacency.indptr[:-1], row_lengths)
+    keep = positions < max_friends
+    rows = np.repeat(np.arange(adjacency.shape[0]), row_lengths)[keep]
+    return sparse.csr_matrix((adjacency.data[keep], (rows, adjacency.indices[keep])), shape=adjacency.shape)
+
+
+def init_worker(adjacency, inactive, max_friends):
+    _graph['adjacency'] = adjacency
+    _graph['inactive'] = inactive
+    _graph['sample'] = sample_adjacency(adjacency, max_friends)
+
+
+def score_rows(start, stop, top_k):
+    """
+    Compute the rows `start` to `stop` of S·A, where S is the sampled
+    adjacency, minus existing edges, the diagonal and the columns of
+    inactive users, and keep the top K entries of each row.
+    @return: list of (user_id, [(candidate_id, mutual_friends), ...]) for
+             every user of the range with friends, best candidates first
+    """
+    adjacency, inactive, sample = _graph['adjacency'], _graph['inactive'], _graph['sample']
+    stop = min(stop, adjacency.shape[0])
+    if start >= stop:
+        return []
+    edges = adjacency[start:stop]
+    scores = (sample[start:stop] @ adjacency).tocsr()
+    # Drop the user and the existing friends from the candidates.
+    excluded = (edges + sparse.eye(stop - start, adjacency.shape[1], k=start, dtype=edges.dtype, format='csr')) > 0
+    scores = (scores - scores.multiply(excluded)).tocsr()
+    scores.eliminate_zeros()
+
+    rows = np.repeat(np.arange(stop - start), np.diff(scores.indptr))
+    # Inactive users still count as mutual friends, but are not candidates.
+    active = ~inactive[scores.indices]
+    rows, candidates, mutual = rows[active], scores.indices[active], scores.data[active]
+
+    # Order every row by (-mutual_friends, candidate_id) and keep its first K.
+    order = np.lexsort((candidates, -mutual, rows))
+    rows, candidates, mutual = rows[order], candidates[order], mutual[order]
+    row_starts = np.searchsorted(rows, np.arange(stop - start))
+    keep = np.arange(len(rows)) - row_starts[rows] < top_k
+    rows, candidates, mutual = rows[keep], candidates[keep].tolist(), mutual[keep].tolist()
+    bounds = np.searchsorted(rows, np.arange(stop - start + 1)).tolist()
+
+    return [
+        (start + row, list(zip(candidates[bounds[row]:bounds[row + 1]], mutual[bounds[row]:bounds[row + 1]])))
+        for row in np.flatnonzero(np.diff(edges.indptr)).tolist()
+    ]
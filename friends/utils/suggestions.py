@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from friends.models import Friendship, FriendSuggestion
+from friends.utils.cache import contains_id, friend_cache, get_friend_ids
+from users.models import User
+
+
+def suggestions_cache_key(user_id):
+    return f"friend-suggestions:{user_id}"
+
+
+def rank_suggestions(user_id, limit=None):
+    """
+    Rank friend candidates for a user by the number of mutual friends.
+
+    Friends-of-friends are counted in a single grouped query bounded by
+    `limit`, so the cost does not depend on how many second-degree
+    connections the user has. When there are not enough of them (e.g. the
+    user has no friends yet) the list is padded with recently joined users.
+    @param user_id: ID of the user to compute suggestions for
+    @param limit: maximum number of suggestions to return
+    @return: list of (user_id, mutual_friends) tuples, best first
+    """
+    limit = limit or settings.FRIEND_SUGGESTIONS_LIMIT
+    # Only a bounded sample of the user's friends is expanded so that
+    # very high degree users stay cheap to rank.
+    sample = get_friend_ids(user_id)[:settings.FRIEND_SUGGESTIONS_MAX_FRIENDS].tolist()
+    return pad_suggestions(user_id, rank_friends_of_friends(user_id, sample, limit), limit)
+
+
+def rank_friends_of_friends(user_id, sample, limit):
+    """
+    Count the mutual friends of the active friends of `sample` who are not
+    yet friends of the user.
+    @param user_id: ID of the user to compute suggestions for
+    @param sample: IDs of the user's friends to expand
+    @param limit: maximum number of candidates to return
+    @return: list of (user_id, mutual_friends) tuples, best first
+    """
+    if not sample:
+        return []
+    # Existing friends are excluded through an indexed subquery rather than
+    # a literal NOT IN list that grows with the user's degree.
+    existing_friends = Friendship.objects.friend_ids(user_id)
+    return list(
+        Friendship.objects.filter(
+            user_id__in=sample, friend__is_active=True
+        ).exclude(
+            friend_id__in=existing_friends
+        ).exclude(
+            friend_id=user_id
+        ).values('friend_id').annotate(
+            mutual_friends=Count('id')
+        ).order_by('-mutual_friends', 'friend_id').values_list(
+            'friend_id', 'mutual_friends'
+        )[:limit]
+    )
+
+
+def pad_suggestions(user_id, ranked, limit):
+    """Pad a ranking shorter than `limit` with recently joined users."""
+    if len(ranked) < limit:
+        seen = [user_id] + [candidate for candidate, _ in ranked]
+        fallback = User.objects.filter(is_active=True).exclude(
+            id__in=seen
+        ).exclude(
+            id__in=Friendship.objects.friend_ids(user_id)
+        ).order_by('-created_on', '-id').values_list('id', flat=True)[:limit - len(ranked)]
+        ranked.extend((candidate, 0) for candidate in fallback)
+    return ranked
+
+
+def precomputed_suggestions(user_id, limit=None):
+    """
+    Read the ranking written by the precompute_suggestions command.
+    Candidates who became friends or were deactivated since the run are
+    skipped.
+    @param user_id: ID of the user to read suggestions for
+    @param limit: maximum number of suggestions to return
+    @return: list of (user_id, mutual_friends) tuples, best first, or None
+             if the user has no precomputed suggestions
+    """
+    limit = limit or settings.FRIEND_SUGGESTIONS_LIMIT
+    rows = list(FriendSuggestion.objects.filter(user_id=user_id, candidate__is_active=True).order_by(
+        'rank').values_list('candidate_id', 'mutual_friends')[:limit])
+    if not rows:
+        return None
+    friend_ids = get_friend_ids(user_id)
+    ranked = [(candidate, mutual) for candidate, mutual in rows if not contains_id(friend_ids, candidate)]
+    return pad_suggestions(user_id, ranked, limit)
+
+
+def get_ranked_suggestions(user_id):
+    """
+    Cached ranking of a user's suggestions, so that paging through them
+    only ranks them once. Served from the precomputed table, users added
+    since the last precompute_suggestions run are ranked online. Kept in
+    the shared friend cache, so the job workers refreshing the table can
+    invalidate it for every web process.
+    """
+    key = suggestions_cache_key(user_id)
+    ranked = friend_cache().get(key)
+    if ranked is None:
+        ranked = precomputed_suggestions(user_id)
+        if ranked is None:
+            ranked = rank_suggestions(user_id)
+        friend_cache().set(key, ranked, settings.FRIEND_SUGGESTIONS_CACHE_TIMEOUT)
+    return ranked
+
+
+def store_suggestions(user_id, ranked):
+    """Replace the precomputed suggestions of a user with `ranked`."""
+    with transaction.atomic():
+        FriendSuggestion.objects.filter(user_id=user_id).delete()
+        FriendSuggestion.objects.bulk_create([
+            FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_friends=mutual, rank=rank)
+            for rank, (candidate_id, mutual) in enumerate(ranked)
+        ])
+    invalidate_suggestions(user_id)
+
+
+def invalidate_suggestions(*user_ids):
+    friend_cache().delete_many([suggestions_cache_key(user_id) for user_id in user_ids])
+
+
+def suggestions_queryset(user_id):
+    """
+    Return a User queryset holding the ranked suggestions, ordered by rank
+    and annotated with `mutual_friends`.
+    """
+    ranked = get_ranked_suggestions(user_id)
+    if not ranked:
+        return User.objects.none()
+
+    return User.objects.filter(
+        id__in=[candidate for candidate, _ in ranked]
+    ).annotate(
+        rank=Case(
+            *[When(id=candidate, then=Value(position)) for position, (candidate, _) in enumerate(ranked)],
+            output_field=IntegerField(),
+        ),
+        mutual_friends=Case(
+            *[When(id=candidate, then=Value(mutual)) for candidate, mutual in ranked],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    ).order_by('rank')
@@ -1,7 +1,9 @@
 
+from django.conf import settings
 from rest_framework import serializers
 from users.models import User
-from friends.models import FriendRequest
+from users.profile_pictures import ThumbnailURLField
+from friends.models import FriendRequest, FriendshipEvent
 
 class FriendRequestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,7 +12,71 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         read_only_fields = ['sender', 'status', 'created_on']
 
 
-class FriendSuggestionSerializer(serializers.ModelSerializer):
+class UserSummarySerializer(serializers.ModelSerializer):
+    profile_thumbnail = ThumbnailURLField('small')
+
     class Meta:
         model = User
-        fields = ['id', 'name', 'email', 'bio', 'profile_picture']
+        fields = ['id', 'name', 'profile_picture', 'profile_thumbnail']
+
+
+class FriendRequestInboxSerializer(FriendRequestSerializer):
+    sender = UserSummarySerializer(read_only=True)
+
+
+class BulkFriendRequestSerializer(serializers.Serializer):
+    receivers = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.FRIEND_REQUEST_BATCH_LIMIT,
+    )
+
+
+class BulkRespondSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.FRIEND_REQUEST_BATCH_LIMIT,
+    )
+    senders = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.FRIEND_REQUEST_BATCH_LIMIT,
+    )
+    status = serializers.ChoiceField(choices=['accepted', 'rejected'])
+
+    def validate(self, attrs):
+        if 'ids' not in attrs and 'senders' not in attrs:
+            raise serializers.ValidationError({"ids": "Provide request ids or senders."})
+        return attrs
+
+
+class MutualFriendCountsSerializer(serializers.Serializer):
+    users = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MUTUAL_FRIENDS_BATCH_LIMIT,
+    )
+
+
+class FriendSerializer(serializers.ModelSerializer):
+    profile_thumbnail = ThumbnailURLField('small')
+
+    class Meta:
+        model = User
+        fields = ['id', 'name', 'email', 'bio', 'profile_picture', 'profile_thumbnail']
+
+
+class FriendSuggestionSerializer(FriendSerializer):
+    mutual_friends = serializers.IntegerField(read_only=True)
+
+    class Meta(FriendSerializer.Meta):
+        fields = FriendSerializer.Meta.fields + ['mutual_friends']
+
+
+class FriendshipEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FriendshipEvent
+        fields = ['id', 'actor', 'target', 'action', 'request_id', 'created_on']
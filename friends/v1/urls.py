@@ -2,15 +2,29 @@ from django.urls import path
 from friends.v1.views import (
     FriendSuggestionsView,
     SendFriendRequestView,
+    BulkSendFriendRequestView,
     ManageFriendRequestView,
+    BulkRespondFriendRequestView,
     ListFriendsView,
+    StreamFriendsView,
+    FriendshipChangesView,
+    MutualFriendsView,
+    MutualFriendCountsView,
+    FriendPathView,
 )
 
 
 urlpatterns = [
     path('suggestions/', FriendSuggestionsView.as_view(), name='friend-suggestions'),
     path('send-request/', SendFriendRequestView.as_view(), name='send-friend-request'),
+    path('send-requests/', BulkSendFriendRequestView.as_view(), name='bulk-send-friend-requests'),
     path('friend-requests/', ManageFriendRequestView.as_view(), name='received-requests'),
     path('request/<int:pk>/respond/', ManageFriendRequestView.as_view(), name='manage-request'),
+    path('requests/respond/', BulkRespondFriendRequestView.as_view(), name='bulk-manage-requests'),
     path('list/', ListFriendsView.as_view(), name='list-friends'),
+    path('list/stream/', StreamFriendsView.as_view(), name='stream-friends'),
+    path('changes/', FriendshipChangesView.as_view(), name='friendship-changes'),
+    path('mutual/counts/', MutualFriendCountsView.as_view(), name='mutual-friend-counts'),
+    path('mutual/<int:user_id>/', MutualFriendsView.as_view(), name='mutual-friends'),
+    path('path/<int:user_id>/', FriendPathView.as_view(), name='friend-path'),
 ]
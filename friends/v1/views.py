@@ -1,48 +1,60 @@
-import random
-from rest_framework import filters
+import logging
+from datetime import timedelta
 from rest_framework.views import APIView
-from rest_framework import generics, status
+from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.response import Response
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-from friends.models import FriendRequest
+from friends.models import FriendRequest, Friendship, FriendshipEvent
 from users.models import User
-from friends.v1.serializers import FriendRequestSerializer, FriendSuggestionSerializer
+from friends.v1.serializers import (
+    BulkFriendRequestSerializer, BulkRespondSerializer, FriendRequestSerializer, FriendRequestInboxSerializer, FriendSerializer, FriendSuggestionSerializer,
+    FriendshipEventSerializer, MutualFriendCountsSerializer, UserSummarySerializer)
+from friends.jobs import schedule_suggestion_refresh
+from friends.utils.cache import count_mutual_friends, get_friend_ids, mutual_friend_ids
+from friends.utils.counters import CounterDeltas
+from friends.utils.friend_requests import (
+    RESULT_ACCEPTED, RESULT_ALREADY_FRIENDS, RESULT_ALREADY_SENT, RESULT_NOT_FOUND, invalidate_friendship,
+    respond_to_friend_requests, send_friend_requests)
+from friends.utils.graph import shortest_friend_path
+from friends.utils.suggestions import suggestions_queryset
+from core.utils.search import IndexedSearchFilter
 from core.utils.common import api_response
-from core.utils.pagination import UserListPagination
+from core.utils.serialization import FastListModelMixin, get_row_serializer
+from core.utils.conditional import ConditionalGetMixin, version_key
+from core.utils.response_cache import CachedResponseMixin
+from core.utils.streaming import iter_ndjson, streaming_response
+from core.utils.pagination import (
+    UserListPagination, UserListCursorPagination, FriendRequestCursorPagination, MutualFriendsPagination)
 
+logger = logging.getLogger(__name__)
 
-class FriendSuggestionsView(generics.ListAPIView):
+
+class FriendSuggestionsView(CachedResponseMixin, FastListModelMixin, generics.ListAPIView):
     """
     get:
-    Returns a paginated list of suggested users to befriend, 
+    Returns a paginated list of suggested users to befriend,
     excluding the current user and their existing friends.
-    Supports optional search filtering by name.
+    Suggestions are ranked by the number of mutual friends, falling back
+    to recently joined users, and capped at FRIEND_SUGGESTIONS_LIMIT.
+    Supports optional search filtering by name, email and location.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = FriendSuggestionSerializer
     pagination_class = UserListPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    filter_backends = [IndexedSearchFilter]
+    search_fields = ['name', 'email', 'location']
+
+    def get_version_keys(self, request):
+        return [version_key('users'), version_key('friends', request.user.id)]
 
     def get_queryset(self):
         try:
-            user = self.request.user
-            friends = FriendRequest.objects.filter(
-                Q(sender=user) | Q(receiver=user),
-                status='accepted'
-            ).values_list('sender', 'receiver')
-
-            friend_ids = set()
-            for sender, receiver in friends:
-                friend_ids.add(sender if receiver == user.id else receiver)
-
-            exclude_ids = list(friend_ids) + [user.id]
-            return User.objects.exclude(id__in=exclude_ids)
+            return suggestions_queryset(self.request.user.id)
         except Exception as e:
             return []
-        
 
 
 class SendFriendRequestView(APIView):
@@ -55,6 +67,8 @@ class SendFriendRequestView(APIView):
     Restrictions:
     - Cannot send to self
     - Cannot duplicate requests
+    A pending request from the receiver is accepted instead of sending a
+    new one, as with the bulk endpoint.
     """
     permission_classes = [IsAuthenticated]
 
@@ -63,24 +77,61 @@ class SendFriendRequestView(APIView):
             receiver_id = request.data.get('receiver')
             if not receiver_id:
                 return api_response(False, "Receiver ID is required.", status_code=400)
-            if int(receiver_id) == request.user.id:
+            receiver_id = int(receiver_id)
+            if receiver_id == request.user.id:
                 return api_response(False, "Cannot send request to yourself.", status_code=400)
-            if FriendRequest.objects.filter(sender=request.user, receiver_id=receiver_id).exists():
-                return api_response(False, "Friend request already sent.", status_code=400)
 
-            friend_request = FriendRequest.objects.create(sender=request.user, receiver_id=receiver_id)
+            [(_, result)] = send_friend_requests(request.user.id, [receiver_id])
+            if result == RESULT_NOT_FOUND:
+                return api_response(False, "User not found.", status_code=404)
+            if result == RESULT_ALREADY_FRIENDS:
+                return api_response(False, "You are already friends.", status_code=400)
+            if result == RESULT_ALREADY_SENT:
+                return api_response(False, "Friend request already sent.", status_code=400)
+            if result == RESULT_ACCEPTED:
+                friend_request = FriendRequest.objects.get(sender_id=receiver_id, receiver_id=request.user.id)
+                message = "Friend request accepted."
+            else:
+                friend_request = FriendRequest.objects.get(sender_id=request.user.id, receiver_id=receiver_id)
+                message = "Friend request sent successfully."
             serialized = FriendRequestSerializer(friend_request).data
-            return api_response(True, "Friend request sent successfully.", serialized, status_code=200)
+            return api_response(True, message, serialized, status_code=200)
         except ValueError:
             return api_response(False, "Receiver ID must be a valid number.", status_code=400)
         except Exception as e:
             return api_response(False, "An unexpected error occurred.", status_code=500)
 
 
+class BulkSendFriendRequestView(APIView):
+    """
+    post:
+    Sends friend requests to many users at once.
+
+    Request body must include:
+    - receivers: list of user IDs (at most FRIEND_REQUEST_BATCH_LIMIT)
+    A pending request from a receiver is accepted instead of sending a new
+    one. Returns the outcome for every receiver ID: sent, accepted,
+    already_sent, already_friends, not_found or self.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkFriendRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return api_response(False, "Validation error.", errors=serializer.errors, status_code=400)
+        try:
+            results = send_friend_requests(request.user.id, serializer.validated_data['receivers'])
+            data = [{'receiver': receiver_id, 'result': result} for receiver_id, result in results]
+            return api_response(True, "Friend requests processed.", data)
+        except Exception as e:
+            return api_response(False, "An unexpected error occurred.", status_code=500)
+
+
 class ManageFriendRequestView(APIView):
     """
      get:
-    List all friend requests received by the logged-in user.
+    List the pending friend requests received by the logged-in user,
+    newest first, with a summary of each sender. Cursor paginated.
 
     patch:
     Accept or reject a friend request.
@@ -91,29 +142,54 @@ class ManageFriendRequestView(APIView):
 
     def get(self, request):
         try:
-            requests = FriendRequest.objects.filter(receiver=request.user, status='pending')
-            serialized = FriendRequestSerializer(requests, many=True).data
-            return api_response(True, "Friend requests received.", serialized)
+            # The sender summary is fetched through one join straight into
+            # the rows of the compiled serializer.
+            row_serializer = get_row_serializer(FriendRequestInboxSerializer)
+            requests = row_serializer.values(
+                FriendRequest.objects.filter(receiver_id=request.user.id, status='pending'),
+                'id',
+            )
+            paginator = FriendRequestCursorPagination()
+            page = paginator.paginate_queryset(requests, request, view=self)
+            return paginator.get_paginated_response(row_serializer.many(page))
         except Exception as e:
             logger.error(f"Error retrieving received requests: {str(e)}")
             return api_response(False, "An unexpected error occurred.", status_code=500)
 
     def patch(self, request, pk):
         try:
-            try:
-                friend_request = FriendRequest.objects.get(pk=pk)
-            except FriendRequest.DoesNotExist:
-                return api_response(False, "Friend request not found.", status_code=404)
-
-            if friend_request.receiver != request.user:
-                return api_response(False, "Unauthorized to update this request.", status_code=403)
-
             new_status = request.data.get('status')
-            if new_status not in ['accepted', 'rejected']:
-                return api_response(False, "Invalid status value.", status_code=400)
+            with transaction.atomic():
+                # The transition is computed from the locked row, so a
+                # concurrent response to the same request is applied once.
+                try:
+                    friend_request = FriendRequest.objects.select_for_update().get(pk=pk)
+                except FriendRequest.DoesNotExist:
+                    return api_response(False, "Friend request not found.", status_code=404)
+
+                if friend_request.receiver_id != request.user.id:
+                    return api_response(False, "Unauthorized to update this request.", status_code=403)
+                if new_status not in ['accepted', 'rejected']:
+                    return api_response(False, "Invalid status value.", status_code=400)
 
-            friend_request.status = new_status
-            friend_request.save()
+                previous_status = friend_request.status
+                if new_status != previous_status:
+                    friend_request.status = new_status
+                    friend_request.save(update_fields=['status', 'modified_on'])
+                    if new_status == 'accepted':
+                        Friendship.objects.link(friend_request.sender_id, friend_request.receiver_id)
+                    elif previous_status == 'accepted':
+                        Friendship.objects.unlink(friend_request.sender_id, friend_request.receiver_id)
+                    FriendshipEvent.objects.record(
+                        new_status, request.user.id, [(friend_request.sender_id, friend_request.id)])
+                    counters = CounterDeltas()
+                    counters.transition(friend_request.sender_id, friend_request.receiver_id,
+                                        previous_status, new_status)
+                    counters.apply()
+                    transaction.on_commit(lambda: invalidate_friendship(
+                        friend_request.sender_id, friend_request.receiver_id))
+                    if 'accepted' in (previous_status, new_status):
+                        schedule_suggestion_refresh(friend_request.sender_id, friend_request.receiver_id)
             serialized = FriendRequestSerializer(friend_request).data
             return api_response(True, f"Friend request {new_status}.", serialized)
         except Exception as e:
@@ -121,34 +197,240 @@ class ManageFriendRequestView(APIView):
 
 
 
-class ListFriendsView(generics.ListAPIView):
+class BulkRespondFriendRequestView(APIView):
+    """
+    patch:
+    Accept or reject many pending friend requests at once.
+    Request body must include:
+    - status: 'accepted' or 'rejected'
+    and at least one of:
+    - ids: list of friend request IDs
+    - senders: list of sender user IDs, matching all their pending requests
+    Returns the IDs of the requests that actually changed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request):
+        serializer = BulkRespondSerializer(data=request.data)
+        if not serializer.is_valid():
+            return api_response(False, "Validation error.", errors=serializer.errors, status_code=400)
+        try:
+            new_status = serializer.validated_data['status']
+            updated = respond_to_friend_requests(
+                request.user.id,
+                new_status,
+                request_ids=serializer.validated_data.get('ids'),
+                sender_ids=serializer.validated_data.get('senders'),
+            )
+            return api_response(True, f"Friend requests {new_status}.", {'updated': updated})
+        except Exception as e:
+            return api_response(False, "An unexpected error occurred.", status_code=500)
+
+
+class ListFriendsView(ConditionalGetMixin, FastListModelMixin, generics.ListAPIView):
     """
     get:
     Lists all friends of the authenticated user (accepted friend requests only).
 
     Supports:
-    - Search filtering by name
+    - Search filtering by name, email and location
     - Pagination
     """
     
     permission_classes = [IsAuthenticated]
-    serializer_class = FriendSuggestionSerializer
-    pagination_class = UserListPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    serializer_class = FriendSerializer
+    pagination_class = UserListCursorPagination
+    filter_backends = [IndexedSearchFilter]
+    search_fields = ['name', 'email', 'location']
+
+    def get_version_keys(self, request):
+        # Friends' profiles are part of the response as well.
+        return [version_key('users'), version_key('friends', request.user.id)]
 
     def get_queryset(self):
         try:
-            user = self.request.user
-            friend_rels = FriendRequest.objects.filter(
-                Q(sender=user) | Q(receiver=user),
-                status='accepted'
-            )
+            friend_ids = get_friend_ids(self.request.user.id)
+            if not friend_ids:
+                return User.objects.none()
+            return User.objects.filter(id__in=friend_ids.tolist())
+        except Exception as e:
+            return []
 
-            friend_ids = []
-            for friend in friend_rels:
-                friend_ids.append(friend.receiver.id if friend.sender == user else friend.sender.id)
 
-            return User.objects.filter(id__in=friend_ids)
+class StreamFriendsView(APIView):
+    """
+    get:
+    Streams every friend of the authenticated user as NDJSON, one friend
+    summary per line ordered by id, straight from a database cursor so
+    memory stays constant whatever the size of the friend list.
+
+    Query parameters:
+    - chunk_size: rows fetched and flushed at a time
+      (default FRIEND_STREAM_CHUNK_SIZE, max FRIEND_STREAM_MAX_CHUNK_SIZE)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', settings.FRIEND_STREAM_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = 0
+        if not 0 < chunk_size <= settings.FRIEND_STREAM_MAX_CHUNK_SIZE:
+            return api_response(False, f"chunk_size must be between 1 and "
+                                       f"{settings.FRIEND_STREAM_MAX_CHUNK_SIZE}.", status_code=400)
+
+        try:
+            row_serializer = get_row_serializer(FriendSerializer)
+            # A subquery keeps the friend ids in the database instead of
+            # loading the whole list first.
+            queryset = User.objects.filter(
+                id__in=Friendship.objects.filter(user_id=request.user.id).values('friend_id')
+            ).order_by('id')
+            rows = row_serializer.values(queryset).iterator(chunk_size=chunk_size)
+            return streaming_response(request, iter_ndjson(rows, row_serializer.to_representation, chunk_size))
         except Exception as e:
-            return []
+            logger.error(f"Error streaming friends: {str(e)}")
+            return api_response(False, "An unexpected error occurred.", status_code=500)
+
+
+class FriendshipChangesView(APIView):
+    """
+    get:
+    Returns the friend request events of the authenticated user (sent,
+    accepted, rejected, by either side) after a cursor, oldest first, so
+    clients can sync deltas instead of re-fetching their lists.
+
+    Query parameters:
+    - since: cursor returned by the previous call. Without it no events are
+      returned, only the cursor to poll from after a full fetch.
+    Responds 410 when events after `since` were already compacted, the
+    client then has to fetch its lists in full again.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            settled = timezone.now() - timedelta(seconds=settings.FRIEND_CHANGES_SETTLE_SECONDS)
+            events = FriendshipEvent.objects.filter(created_on__lte=settled)
+
+            since = request.query_params.get('since')
+            if since is None:
+                cursor = events.order_by('-id').values_list('id', flat=True).first() or 0
+                return api_response(True, "Friendship changes.", {'cursor': cursor, 'has_more': False, 'events': []})
+            since = int(since)
+            if since < 0:
+                raise ValueError(since)
+
+            oldest = FriendshipEvent.objects.order_by('id').values_list('id', flat=True).first()
+            if oldest is not None and since < oldest - 1:
+                return api_response(False, "Cursor expired, fetch the friend list again.", status_code=410)
+
+            page_size = settings.FRIEND_CHANGES_PAGE_SIZE
+            row_serializer = get_row_serializer(FriendshipEventSerializer)
+            rows = list(row_serializer.values(
+                events.filter(user_id=request.user.id, id__gt=since).order_by('id'))[:page_size + 1])
+            data = {
+                'cursor': rows[:page_size][-1]['id'] if rows else since,
+                'has_more': len(rows) > page_size,
+                'events': row_serializer.many(rows[:page_size]),
+            }
+            return api_response(True, "Friendship changes.", data)
+        except ValueError:
+            return api_response(False, "since must be a cursor returned by this endpoint.", status_code=400)
+        except Exception as e:
+            logger.error(f"Error retrieving friendship changes: {str(e)}")
+            return api_response(False, "An unexpected error occurred.", status_code=500)
+
+
+class MutualFriendsView(APIView):
+    """
+    get:
+    Returns the friends the authenticated user shares with another user:
+    the total count and a page of user summaries ordered by id.
+    The intersection is computed over the cached sorted friend ID arrays.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        try:
+            ids = mutual_friend_ids(request.user.id, user_id)
+            paginator = MutualFriendsPagination()
+            page = paginator.paginate_queryset(ids, request, view=self)
+            row_serializer = get_row_serializer(UserSummarySerializer)
+            rows = {row['id']: row for row in row_serializer.values(User.objects.filter(id__in=page))}
+            # Deleted users may still be cached for a moment.
+            data = [row_serializer.to_representation(rows[friend_id]) for friend_id in page if friend_id in rows]
+            return paginator.get_paginated_response(data)
+        except Exception as e:
+            logger.error(f"Error retrieving mutual friends: {str(e)}")
+            return api_response(False, "An unexpected error occurred.", status_code=500)
+
+
+class MutualFriendCountsView(APIView):
+    """
+    get:
+    Returns how many friends the authenticated user shares with each of
+    a batch of users, e.g. for a page of profile cards.
+
+    Query parameters:
+    - users: comma separated user IDs (at most MUTUAL_FRIENDS_BATCH_LIMIT)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        users = [value for value in request.query_params.get('users', '').split(',') if value]
+        serializer = MutualFriendCountsSerializer(data={'users': users})
+        if not serializer.is_valid():
+            return api_response(False, "Validation error.", errors=serializer.errors, status_code=400)
+        try:
+            user_ids = list(dict.fromkeys(serializer.validated_data['users']))
+            counts = count_mutual_friends(request.user.id, user_ids)
+            data = [{'user': user_id, 'mutual_friends': counts[user_id]} for user_id in user_ids]
+            return api_response(True, "Mutual friend counts fetched successfully.", data)
+        except Exception as e:
+            logger.error(f"Error counting mutual friends: {str(e)}")
+            return api_response(False, "An unexpected error occurred.", status_code=500)
+
+
+class FriendPathView(APIView):
+    """
+    get:
+    Returns how the authenticated user is connected to another user: the
+    shortest chain of friendships between them as user summaries, from
+    the authenticated user to the target, and its number of degrees.
+
+    Query parameters:
+    - max_depth: longest chain to look for (default and cap FRIEND_PATH_MAX_DEPTH)
+    The search also stops after discovering FRIEND_PATH_MAX_VISITED users,
+    `truncated` is then true and the path may be missing or not the shortest.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        try:
+            max_depth = int(request.query_params.get('max_depth', settings.FRIEND_PATH_MAX_DEPTH))
+        except ValueError:
+            max_depth = 0
+        if not 0 < max_depth <= settings.FRIEND_PATH_MAX_DEPTH:
+            return api_response(False, f"max_depth must be between 1 and {settings.FRIEND_PATH_MAX_DEPTH}.",
+                                status_code=400)
+        try:
+            path, truncated = shortest_friend_path(
+                request.user.id, user_id, max_depth, settings.FRIEND_PATH_MAX_VISITED)
+            if path is None:
+                return api_response(True, "No connection found.", {
+                    'degrees': None, 'path': [], 'truncated': truncated})
+
+            row_serializer = get_row_serializer(UserSummarySerializer)
+            rows = {row['id']: row for row in row_serializer.values(User.objects.filter(id__in=path))}
+            if len(rows) < len(path):
+                return api_response(False, "User not found.", status_code=404)
+            data = {
+                'degrees': len(path) - 1,
+                'path': [row_serializer.to_representation(rows[node]) for node in path],
+                'truncated': truncated,
+            }
+            return api_response(True, "Connection found.", data)
+        except Exception as e:
+            logger.error(f"Error searching friend path: {str(e)}")
+            return api_response(False, "An unexpected error occurred.", status_code=500)
@@ -10,10 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from datetime import timedelta
 
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # social api apps
     'core',
@@ -52,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +87,8 @@ WSGI_APPLICATION = 'social_app.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Set DATABASES_ENGINE=django.db.backends.sqlite3 to run locally on SQLite.
+DATABASES_ENGINE = config('DATABASES_ENGINE', 'django.db.backends.postgresql_psycopg2')
 DATABASES_NAME = config('DATABASES_NAME', '')
 DATABASES_USER = config('DATABASES_USER', '')
 DATABASES_PASSWORD = config('DATABASES_PASSWORD', '')
@@ -91,7 +97,7 @@ DATABASES_PORT = config('DATABASES_PORT', '')
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': DATABASES_ENGINE,
         'NAME': DATABASES_NAME,
         'USER': DATABASES_USER,
         'PASSWORD': DATABASES_PASSWORD,
@@ -100,6 +106,22 @@ DATABASES = {
     }
 }
 
+# Read replicas
+# Comma separated hosts (PostgreSQL) or database files (SQLite) holding
+# replicas of the default database. Safe requests read from a random one.
+DATABASES_REPLICAS = config('DATABASES_REPLICAS', default='', cast=Csv())
+for index, replica in enumerate(DATABASES_REPLICAS, 1):
+    location = {'NAME': replica} if DATABASES_ENGINE.endswith('sqlite3') else {'HOST': replica}
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], **location, 'TEST': {'MIRROR': 'default'}}
+REPLICA_DATABASES = [f'replica{index}' for index in range(1, len(DATABASES_REPLICAS) + 1)]
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Clients read from the primary for this long after a write, which has to
+# cover the replication lag.
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'pin_primary'
+REPLICA_PIN_CACHE_ALIAS = 'friends'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,11 +143,12 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 REST_FRAMEWORK = {
+    # MessagePack is offered through content negotiation when installed.
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-    ),
+        'core.utils.renderers.FastJSONRenderer',
+    ) + (('core.utils.renderers.MessagePackRenderer',) if find_spec('msgpack') else ()),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -153,6 +176,16 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Profile pictures
+# Originals and thumbnails are stored under MEDIA_ROOT with content hashed
+# names, list endpoints link the `small` thumbnail.
+PROFILE_PICTURE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+PROFILE_PICTURE_MAX_PIXELS = 40_000_000
+PROFILE_PICTURE_THUMBNAIL_SIZES = {'small': 80, 'large': 320}
+PROFILE_PICTURE_THUMBNAIL_QUALITY = 85
+# Sent with pictures served by Django, configure the web server the same way.
+PROFILE_PICTURE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -195,3 +228,116 @@ TOKEN_COOKIE_DOMAIN = 'http://127.0.0.1'
 SESSION_COOKIE_SAMESITE = 'Lax'
 
 AUTH_USER_MODEL = 'users.User'
+
+# Google OAuth
+GOOGLE_USERINFO_URL = 'https://www.googleapis.com/oauth2/v2/userinfo'
+GOOGLE_OAUTH_CONNECT_TIMEOUT = 3
+GOOGLE_OAUTH_READ_TIMEOUT = 5
+GOOGLE_OAUTH_POOL_SIZE = 10
+GOOGLE_USERINFO_CACHE_TIMEOUT = 60
+
+# Friend requests
+FRIEND_REQUEST_BATCH_LIMIT = 500
+
+# Friend suggestions
+FRIEND_SUGGESTIONS_LIMIT = 100
+FRIEND_SUGGESTIONS_MAX_FRIENDS = 1000
+FRIEND_SUGGESTIONS_CACHE_TIMEOUT = 300
+
+# Mutual friends, target users per count request
+MUTUAL_FRIENDS_BATCH_LIMIT = 100
+
+# Degrees of separation search caps
+FRIEND_PATH_MAX_DEPTH = 6
+FRIEND_PATH_MAX_VISITED = 50000
+
+# Friend list streaming, rows fetched and flushed per chunk
+FRIEND_STREAM_CHUNK_SIZE = 1000
+FRIEND_STREAM_MAX_CHUNK_SIZE = 10000
+
+# Friendship change feed
+# Events younger than the settle window are held back, so a transaction
+# committing after a later sequence number cannot be skipped by a cursor.
+FRIEND_CHANGES_PAGE_SIZE = 500
+FRIEND_CHANGES_SETTLE_SECONDS = 1
+FRIEND_CHANGES_RETENTION_DAYS = 30
+
+# Cache
+# The friend graph cache uses Redis when REDIS_URL is set (requires the
+# `redis` package), and a per-process local memory cache otherwise, which
+# is only correct with a single process (see the core.W001 check).
+REDIS_URL = config('REDIS_URL', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'friends': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'friends',
+    },
+}
+
+# Token revocation and deactivation must reach every process.
+USER_SNAPSHOT_CACHE_ALIAS = 'friends'
+USER_SNAPSHOT_CACHE_TIMEOUT = 60 * 15
+
+FRIEND_CACHE_ALIAS = 'friends'
+# Versions behind ETag / Last-Modified must be shared by all processes.
+# They expire so that a missed bump cannot serve stale 304s forever, an
+# expired version restarts at the current time.
+VERSION_CACHE_ALIAS = 'friends'
+VERSION_CACHE_TIMEOUT = 60 * 60
+# Versions that are never bumped and only expire. The friend and pending
+# request counters shown in the user list change with every friend request
+# anywhere, so the list is allowed to show them up to a minute late.
+VERSION_CACHE_TIMEOUTS = {
+    'user-counters': 60,
+}
+FRIEND_IDS_CACHE_TIMEOUT = 60 * 60
+
+# Response cache for hot list pages, keyed by user, query and versions.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Pagination
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# Search
+# Terms shorter than a trigram fall back to plain substring matching.
+SEARCH_MIN_TERM_LENGTH = 3
+
+# Metrics
+# Per-view latency and query histograms are served at /metrics/ for the
+# listed scraper addresses. Requests running more queries than their view's
+# budget (by URL name) are logged, a sampled share with the stack of the
+# first query over budget.
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGETS = {
+    'profile': 3,
+    'user-list': 4,
+    'friend-suggestions': 6,
+    'list-friends': 4,
+    'received-requests': 4,
+    'send-friend-request': 10,
+    'bulk-send-friend-requests': 10,
+    'manage-request': 10,
+    'bulk-manage-requests': 10,
+}
+QUERY_BUDGET_SAMPLE_RATE = config('QUERY_BUDGET_SAMPLE_RATE', default=0.1, cast=float)
+QUERY_BUDGET_STACK_LIMIT = 30
+
+# Background jobs
+# Queued in the database and run by `python manage.py run_jobs`. Failed jobs
+# are retried with exponential backoff (seconds), a running job whose lease
+# expired is assumed lost and run again.
+JOB_WORKERS = 4
+JOB_POLL_INTERVAL = 1.0
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_BACKOFF_MAX = 60 * 60
+JOB_LEASE_SECONDS = 60 * 10
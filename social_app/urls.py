@@ -19,9 +19,16 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 
+from core.views import metrics
+from users.profile_pictures import PROFILE_PICTURE_DIR, serve_profile_picture
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('users/', include('users.urls')),
     path('friends/', include('friends.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+    path('metrics/', metrics, name='metrics'),
+] + static(f'{settings.MEDIA_URL}{PROFILE_PICTURE_DIR}/', view=serve_profile_picture,
+           document_root=settings.MEDIA_ROOT / PROFILE_PICTURE_DIR) + static(
+    settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
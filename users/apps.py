@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def sync_search_index(sender, using, **kwargs):
+    """Restore the SQLite FTS5 search index after migrations."""
+    from core.utils.search import ensure_fts_index
+    from users.models import User
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and User._meta.db_table in connection.introspection.table_names():
+        ensure_fts_index(connection, User._meta.db_table, User._meta.pk.column, ['name', 'email', 'location'])
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from users import signals  # noqa: F401
+
+        post_migrate.connect(sync_search_index, sender=self)
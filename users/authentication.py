@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.routers import get_read_alias, is_user_pinned, set_read_alias
+from users.models import User
+
+
+TOKEN_VERSION_CLAIM = 'ver'
+SNAPSHOT_FIELDS = ('id', 'email', 'name', 'is_active', 'token_version')
+
+
+def user_snapshot_key(user_id):
+    return f"user-snapshot:{user_id}"
+
+
+def snapshot_cache():
+    # Shared by all processes, so a revocation takes effect everywhere.
+    return caches[settings.USER_SNAPSHOT_CACHE_ALIAS]
+
+
+def get_user_snapshot(user_id):
+    """
+    Return the cached snapshot of a user, loading it from the database on
+    a cache miss.
+    @param user_id: ID of the user
+    @return: dict with SNAPSHOT_FIELDS, or None if the user does not exist
+    """
+    key = user_snapshot_key(user_id)
+    cache = snapshot_cache()
+    snapshot = cache.get(key)
+    if snapshot is None:
+        # Read from the primary, a lagging replica would be cached for long.
+        snapshot = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values(*SNAPSHOT_FIELDS).first()
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, settings.USER_SNAPSHOT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def invalidate_user_snapshot(user_id):
+    snapshot_cache().delete(user_snapshot_key(user_id))
+
+
+def tokens_for_user(user):
+    """
+    Util method to create a refresh token carrying the claims needed to
+    authenticate without a database lookup. The access token derived from
+    it inherits the same claims.
+    @param user: User instance
+    @return: RefreshToken
+    """
+    refresh = RefreshToken.for_user(user)
+    refresh['email'] = user.email
+    refresh['name'] = user.name
+    refresh[TOKEN_VERSION_CLAIM] = user.token_version
+    return refresh
+
+
+class SnapshotUser(TokenUser):
+    """
+    Lightweight stand-in for `request.user` built from the token and the
+    cached user snapshot. Views that need to write to the user must load
+    the model instance themselves.
+    """
+
+    def __init__(self, token, snapshot):
+        super().__init__(token)
+        self.snapshot = snapshot
+
+    @cached_property
+    def id(self):
+        return self.snapshot['id']
+
+    @property
+    def email(self):
+        return self.snapshot['email']
+
+    @property
+    def name(self):
+        return self.snapshot['name']
+
+    @property
+    def is_active(self):
+        return self.snapshot['is_active']
+
+    @property
+    def token_version(self):
+        return self.snapshot['token_version']
+
+    def __str__(self):
+        return self.email
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds `request.user` from token claims plus a
+    cached user snapshot, only querying the database on a cache miss.
+    Tokens issued before the user's token version was bumped are rejected.
+    Users who wrote recently are switched back to reading from the primary.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if get_read_alias() is not None and is_user_pinned(user_id):
+            set_read_alias(None)
+
+        snapshot = get_user_snapshot(user_id)
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not snapshot['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token.get(TOKEN_VERSION_CLAIM, 0) != snapshot['token_version']:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return SnapshotUser(validated_token, snapshot)
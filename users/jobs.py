@@ -0,0 +1,30 @@
+from core.utils.jobs import enqueue_many, register_job
+from users.models import User
+from users.profile_pictures import activate_profile_picture, render_thumbnails, store_profile_picture
+
+
+@register_job
+def process_profile_picture(user_id, digest, name):
+    """
+    Generate the thumbnails of an uploaded picture, then show it on the
+    profile. Retried by the queue when it fails, the user keeps the
+    previous picture until then.
+    """
+    render_thumbnails(digest, name)
+    activate_profile_picture(user_id, digest, name)
+
+
+def upload_profile_picture(user_id, upload):
+    """
+    Store an uploaded profile picture and queue its thumbnails once the
+    current transaction commits. The user keeps the previous picture until
+    the thumbnails are ready.
+    @param user_id: ID of the user
+    @param upload: UploadedFile
+    @return: digest of the picture
+    @raise InvalidProfilePicture: if the upload is not a supported image
+    """
+    digest, name = store_profile_picture(upload)
+    User.objects.filter(pk=user_id).update(profile_picture_pending=digest)
+    enqueue_many(process_profile_picture, [(user_id, digest, name)], dedup=True, on_commit=True)
+    return digest
@@ -0,0 +1,40 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from core.utils.search import drop_fts_index, ensure_fts_index
+
+
+SEARCH_COLUMNS = ('name', 'email', 'location')
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS users_user_{column}_trgm_idx "
+                f"ON users_user USING gin ({column} gin_trgm_ops)"
+            )
+    elif vendor == 'sqlite':
+        ensure_fts_index(schema_editor.connection, 'users_user', 'id', SEARCH_COLUMNS)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS users_user_{column}_trgm_idx")
+    elif vendor == 'sqlite':
+        drop_fts_index(schema_editor.connection, 'users_user')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_created_on_id_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
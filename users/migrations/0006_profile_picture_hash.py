@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_friend_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_picture_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_picture_pending',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
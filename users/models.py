@@ -52,15 +52,32 @@ class User(AbstractUser, AbstractDateBase):
     email = models.EmailField(unique=True)
     name = models.CharField(max_length=255)
     profile_picture = models.URLField(blank=True, null=True)
+    # Content hash naming the uploaded picture and its thumbnails, and the
+    # hash of an upload whose thumbnails are still being generated, see
+    # users.profile_pictures.
+    profile_picture_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
+    profile_picture_pending = models.CharField(max_length=32, blank=True, null=True, editable=False)
     location = models.CharField(max_length=255, blank=True, null=True)
     bio = models.TextField(blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
+    token_version = models.PositiveIntegerField(default=0,
+                                                help_text='Bumped to revoke '
+                                                          'previously issued tokens')
+    # Maintained by the friend request flows, see friends.utils.counters.
+    friends_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_received_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_sent_count = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name']
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['created_on', 'id'], name='user_created_on_id_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
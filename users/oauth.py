@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+
+class GoogleAuthError(Exception):
+    """Raised when Google rejects the access token."""
+
+
+class GoogleAuthUnavailable(GoogleAuthError):
+    """Raised when Google could not be reached in time."""
+
+
+_session = None
+
+
+def get_session():
+    """
+    Return the process wide HTTP session used to talk to Google, so
+    connections are pooled and reused between requests.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.GOOGLE_OAUTH_POOL_SIZE,
+            max_retries=0,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+
+# One client per event loop, an httpx.AsyncClient cannot be shared between loops.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Return the HTTP client of the running event loop used to talk to
+    Google, with the same pool size and timeouts as `get_session()`.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.GOOGLE_OAUTH_READ_TIMEOUT, connect=settings.GOOGLE_OAUTH_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.GOOGLE_OAUTH_POOL_SIZE),
+        )
+    return client
+
+
+def userinfo_cache_key(access_token):
+    # Never store the raw token in the cache.
+    return 'google-userinfo:' + hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def fetch_google_userinfo(access_token):
+    """
+    Fetch the Google profile of the owner of `access_token`.
+    Successful responses are cached for GOOGLE_USERINFO_CACHE_TIMEOUT
+    seconds so that client retries do not hit Google again.
+    @param access_token: Google OAuth2 access token
+    @return: dict with the Google userinfo payload
+    """
+    key = userinfo_cache_key(access_token)
+    user_info = cache.get(key)
+    if user_info is not None:
+        return user_info
+
+    try:
+        response = get_session().get(
+            settings.GOOGLE_USERINFO_URL,
+            headers={'Authorization': f'Bearer {access_token}'},
+            timeout=(settings.GOOGLE_OAUTH_CONNECT_TIMEOUT, settings.GOOGLE_OAUTH_READ_TIMEOUT),
+        )
+    except requests.RequestException as exc:
+        raise GoogleAuthUnavailable(str(exc)) from exc
+
+    user_info = parse_userinfo(response)
+    cache.set(key, user_info, settings.GOOGLE_USERINFO_CACHE_TIMEOUT)
+    return user_info
+
+
+async def afetch_google_userinfo(access_token):
+    """
+    Non-blocking variant of `fetch_google_userinfo` for the ASGI app,
+    sharing its cache and timeouts.
+    @param access_token: Google OAuth2 access token
+    @return: dict with the Google userinfo payload
+    """
+    key = userinfo_cache_key(access_token)
+    user_info = await cache.aget(key)
+    if user_info is not None:
+        return user_info
+
+    try:
+        response = await get_async_client().get(
+            settings.GOOGLE_USERINFO_URL,
+            headers={'Authorization': f'Bearer {access_token}'},
+        )
+    except httpx.HTTPError as exc:
+        raise GoogleAuthUnavailable(str(exc)) from exc
+
+    user_info = parse_userinfo(response)
+    await cache.aset(key, user_info, settings.GOOGLE_USERINFO_CACHE_TIMEOUT)
+    return user_info
+
+
+def parse_userinfo(response):
+    """
+    Util method reading the userinfo payload of a requests or httpx response.
+    @raise GoogleAuthError: if Google rejected the token
+    @raise GoogleAuthUnavailable: if the payload is not JSON
+    """
+    if response.status_code != 200:
+        raise GoogleAuthError(f"Google returned status {response.status_code}.")
+    try:
+        return response.json()
+    except ValueError as exc:
+        raise GoogleAuthUnavailable("Invalid response from Google.") from exc
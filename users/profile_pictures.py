@@ -0,0 +1,144 @@
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.views.static import serve
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from core.utils.conditional import bump_versions, version_key
+from core.utils.serialization import ConvertedField
+from users.models import User
+
+
+PROFILE_PICTURE_DIR = 'profile_pictures'
+# Pillow format -> file extension of the stored original.
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class InvalidProfilePicture(Exception):
+    """Raised when an upload is not an image that can be used as a profile picture."""
+
+
+def thumbnail_name(digest, size):
+    return f'{PROFILE_PICTURE_DIR}/{digest}_{size}.jpg'
+
+
+def thumbnail_url(digest, size):
+    """
+    URL of the `size` thumbnail of a picture. Names are derived from the
+    content hash, so the files never change and can be cached forever.
+    @param digest: content hash of the original picture
+    @param size: name of a size of PROFILE_PICTURE_THUMBNAIL_SIZES
+    """
+    return default_storage.url(thumbnail_name(digest, settings.PROFILE_PICTURE_THUMBNAIL_SIZES[size]))
+
+
+def thumbnail_urls(digest):
+    return {size: thumbnail_url(digest, size) for size in settings.PROFILE_PICTURE_THUMBNAIL_SIZES}
+
+
+class ThumbnailURLField(ConvertedField):
+    """Renders the profile picture hash of a user as the URL of one thumbnail size."""
+
+    def __init__(self, size, **kwargs):
+        kwargs.setdefault('source', 'profile_picture_hash')
+        super().__init__(**kwargs)
+        self.size = size
+
+    def to_representation(self, value):
+        return thumbnail_url(value, self.size)
+
+
+def store_profile_picture(upload):
+    """
+    Validate an uploaded picture and store the original under its content
+    hash. Uploading the same content again reuses the stored file.
+    @param upload: UploadedFile
+    @return: (digest, name) of the stored original
+    @raise InvalidProfilePicture: if the upload is not a supported image
+    """
+    if upload.size > settings.PROFILE_PICTURE_MAX_UPLOAD_SIZE:
+        raise InvalidProfilePicture('The picture is too large.')
+
+    sha = hashlib.sha256()
+    for chunk in upload.chunks():
+        sha.update(chunk)
+    digest = sha.hexdigest()[:32]
+
+    # Only the header is read here, decoding is left to the thumbnail job.
+    try:
+        upload.seek(0)
+        with Image.open(upload) as image:
+            image_format = image.format
+            width, height = image.size
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidProfilePicture('The file is not a valid image.')
+    if image_format not in FORMATS:
+        raise InvalidProfilePicture('Unsupported image format.')
+    if width * height > settings.PROFILE_PICTURE_MAX_PIXELS:
+        raise InvalidProfilePicture('The picture dimensions are too large.')
+
+    name = f'{PROFILE_PICTURE_DIR}/{digest}.{FORMATS[image_format]}'
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+    return digest, name
+
+
+def render_thumbnails(digest, name):
+    """
+    Write the missing thumbnails of a stored original, largest first, each
+    one downscaled from the previous to keep the resampling cheap.
+    """
+    sizes = sorted(set(settings.PROFILE_PICTURE_THUMBNAIL_SIZES.values()), reverse=True)
+    missing = [size for size in sizes if not default_storage.exists(thumbnail_name(digest, size))]
+    if not missing:
+        return
+
+    with default_storage.open(name) as source, Image.open(source) as image:
+        # Lets the JPEG decoder scale down while decoding.
+        image.draft('RGB', (missing[0], missing[0]))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+
+        for size in missing:
+            image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=settings.PROFILE_PICTURE_THUMBNAIL_QUALITY,
+                       optimize=True, progressive=True)
+            thumbnail = thumbnail_name(digest, size)
+            if not default_storage.exists(thumbnail):
+                default_storage.save(thumbnail, ContentFile(buffer.getvalue()))
+
+
+def activate_profile_picture(user_id, digest, name):
+    """
+    Switch the user to a picture whose thumbnails exist, unless a newer
+    upload replaced it in the meantime.
+    """
+    updated = User.objects.filter(pk=user_id, profile_picture_pending=digest).update(
+        profile_picture=default_storage.url(name),
+        profile_picture_hash=digest,
+        profile_picture_pending=None,
+        modified_on=timezone.now(),
+    )
+    if updated:
+        bump_versions(version_key('users'), version_key('user', user_id))
+
+
+def serve_profile_picture(request, path, document_root=None):
+    """
+    Serve a stored picture or thumbnail. Names are derived from the
+    content hash, so the files can be cached forever.
+    """
+    response = serve(request, path, document_root=document_root)
+    response['Cache-Control'] = settings.PROFILE_PICTURE_CACHE_CONTROL
+    return response
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.utils.conditional import bump_versions, version_key
+from users.authentication import invalidate_user_snapshot
+from users.models import User
+
+
+# Fields shown to other users in the user list, changing them invalidates
+# every cached page of it. Anything else only concerns the user's profile.
+LISTED_FIELDS = frozenset(['name', 'email', 'bio', 'profile_picture', 'profile_picture_hash', 'location',
+                           'birth_date', 'is_active'])
+
+
+@receiver([post_save, post_delete], sender=User)
+def bump_user_versions(sender, instance, created=False, update_fields=None, **kwargs):
+    """Invalidate conditional GET validators once a user change is committed."""
+    user_id = instance.pk
+    keys = [version_key('user', user_id)]
+    if created or kwargs['signal'] is post_delete or update_fields is None or LISTED_FIELDS & update_fields:
+        keys.append(version_key('users'))
+    transaction.on_commit(lambda: bump_versions(*keys))
+
+
+@receiver([post_save, post_delete], sender=User)
+def drop_user_snapshot(sender, instance, **kwargs):
+    """Make token revocation, deactivation and deletion apply to the next request."""
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user_snapshot(user_id))
@@ -1,3 +1,273 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from core.models import Job
+from core.utils.conditional import version_cache, version_key
+from core.utils.jobs import claim_jobs, finish_job, run_job
+from users.authentication import tokens_for_user
+from users.models import User
+from users.oauth import (
+    GoogleAuthError, GoogleAuthUnavailable, afetch_google_userinfo, fetch_google_userinfo, userinfo_cache_key,
+)
+from users.profile_pictures import PROFILE_PICTURE_DIR, serve_profile_picture, thumbnail_name
+from users.v1.serializers import GoogleAuthSerializer
+
+
+class FakeUserinfoHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for Google's userinfo endpoint."""
+
+    def do_GET(self):
+        self.server.hits += 1
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        if token == 'slow-token':
+            time.sleep(0.5)
+        if token.startswith('valid'):
+            body = json.dumps({'email': f'{token}@example.com', 'name': 'Google User'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUserinfoServerMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeUserinfoHandler)
+        cls.server.hits = 0
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.userinfo_settings = override_settings(
+            GOOGLE_USERINFO_URL=f'http://127.0.0.1:{cls.server.server_port}/userinfo',
+            GOOGLE_OAUTH_READ_TIMEOUT=0.2,
+        )
+        cls.userinfo_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.userinfo_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.hits = 0
+
+
+class GoogleUserinfoTests(FakeUserinfoServerMixin, SimpleTestCase):
+
+    def test_valid_token_returns_userinfo(self):
+        user_info = fetch_google_userinfo('valid-a')
+        self.assertEqual(user_info['email'], 'valid-a@example.com')
+
+    def test_userinfo_is_cached(self):
+        fetch_google_userinfo('valid-b')
+        fetch_google_userinfo('valid-b')
+        self.assertEqual(self.server.hits, 1)
+
+    def test_invalid_token_raises_and_is_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(GoogleAuthError):
+                fetch_google_userinfo('bad-token')
+        self.assertEqual(self.server.hits, 2)
+
+    def test_slow_upstream_times_out(self):
+        with self.assertRaises(GoogleAuthUnavailable):
+            fetch_google_userinfo('slow-token')
+
+
+class AsyncGoogleUserinfoTests(FakeUserinfoServerMixin, SimpleTestCase):
+
+    async def test_valid_token_returns_userinfo(self):
+        user_info = await afetch_google_userinfo('valid-c')
+        self.assertEqual(user_info['email'], 'valid-c@example.com')
+
+    async def test_cache_is_shared_with_the_sync_variant(self):
+        await afetch_google_userinfo('valid-d')
+        await afetch_google_userinfo('valid-d')
+        self.assertEqual(self.server.hits, 1)
+        self.assertEqual(cache.get(userinfo_cache_key('valid-d'))['email'], 'valid-d@example.com')
+
+    async def test_invalid_token_raises_and_is_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(GoogleAuthError):
+                await afetch_google_userinfo('bad-token')
+        self.assertEqual(self.server.hits, 2)
+
+    async def test_slow_upstream_times_out(self):
+        with self.assertRaises(GoogleAuthUnavailable):
+            await afetch_google_userinfo('slow-token')
+
+
+class GoogleAuthSerializerTests(FakeUserinfoServerMixin, TestCase):
+
+    def test_creates_user_and_returns_tokens(self):
+        serializer = GoogleAuthSerializer(data={'access_token': 'valid-d'})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertIn('access', serializer.validated_data)
+        self.assertTrue(User.objects.filter(email='valid-d@example.com').exists())
+
+    def test_invalid_token_is_a_validation_error(self):
+        serializer = GoogleAuthSerializer(data={'access_token': 'bad-token'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('access_token', serializer.errors)
+
+
+class GoogleAuthViewTests(FakeUserinfoServerMixin, TestCase):
+
+    def test_upstream_outage_is_503(self):
+        response = self.client.post('/users/api/v1/google-auth/', {'access_token': 'slow-token'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_invalid_token_is_400(self):
+        response = self.client.post('/users/api/v1/google-auth/', {'access_token': 'bad-token'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(email='member@example.com', password='Old-passw0rd!', name='Member')
+        self.access = str(tokens_for_user(self.user).access_token)
+
+    def get_profile(self, access):
+        return self.client.get('/users/api/v1/profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_password_change_revokes_tokens_and_returns_new_ones(self):
+        self.assertEqual(self.get_profile(self.access).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/users/api/v1/profile/', {'password': 'New-passw0rd!'},
+                                         content_type='application/json',
+                                         HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+        self.assertEqual(self.get_profile(response.json()['data']['token']).status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        # Caches the snapshot.
+        self.assertEqual(self.get_profile(self.access).status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+
+
+class UserListVersionTests(TestCase):
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.viewer, self.sender, self.receiver = [
+            User.objects.create_user(email=f'user{i}@example.com', name=f'User {i}') for i in range(3)]
+
+    def request(self, method, user, path, data=None, **extra):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(user).access_token}'}
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(path, data, content_type='application/json', **auth, **extra)
+
+    def test_friend_requests_keep_the_list_cached(self):
+        etag = self.request('get', self.viewer, '/users/api/v1/users/')['ETag']
+        profile_etag = self.request('get', self.sender, '/users/api/v1/profile/')['ETag']
+
+        self.request('post', self.sender, '/friends/api/v1/send-request/', {'receiver': self.receiver.id})
+
+        response = self.request('get', self.viewer, '/users/api/v1/users/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.request('get', self.sender, '/users/api/v1/profile/', HTTP_IF_NONE_MATCH=profile_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['pending_sent_count'], 1)
+
+        # The list catches up once the counters version expires.
+        version_cache().delete(version_key('user-counters'))
+        response = self.request('get', self.viewer, '/users/api/v1/users/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        counts = {user['id']: user['pending_sent_count'] for user in response.json()['data']['results']}
+        self.assertEqual(counts[self.sender.id], 1)
+
+    def test_listed_field_change_invalidates_the_list(self):
+        etag = self.request('get', self.viewer, '/users/api/v1/users/')['ETag']
+        self.request('patch', self.sender, '/users/api/v1/profile/', {'bio': 'Hello'})
+        response = self.request('get', self.viewer, '/users/api/v1/users/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilePictureTests(TestCase):
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.user = User.objects.create_user(email='member@example.com', name='Member')
+
+    def upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 300), (200, 40, 40)).save(buffer, 'PNG')
+        picture = SimpleUploadedFile('picture.png', buffer.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/users/api/v1/profile/', {'picture': picture},
+                                    HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.user).access_token}')
+
+    def test_thumbnails_are_generated_by_a_job(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 202)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.profile_picture_pending)
+        self.assertIsNone(self.user.profile_picture_hash)
+
+        [(job_id, name, args)] = claim_jobs(10)
+        self.assertIsNone(run_job(name, args))
+        finish_job(job_id)
+
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.profile_picture_pending)
+        for size in settings.PROFILE_PICTURE_THUMBNAIL_SIZES.values():
+            self.assertTrue(os.path.exists(os.path.join(
+                self.media.name, thumbnail_name(self.user.profile_picture_hash, size))))
+        self.assertFalse(Job.objects.exists())
+
+        size = settings.PROFILE_PICTURE_THUMBNAIL_SIZES['small']
+        thumbnail = thumbnail_name(self.user.profile_picture_hash, size)
+        response = serve_profile_picture(RequestFactory().get('/'), thumbnail[len(PROFILE_PICTURE_DIR) + 1:],
+                                         document_root=os.path.join(self.media.name, PROFILE_PICTURE_DIR))
+        self.assertEqual(response['Cache-Control'], settings.PROFILE_PICTURE_CACHE_CONTROL)
+
+
+class ResponseCacheMetricsTests(TestCase):
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(email='member@example.com', name='Member')
+
+    def test_hits_and_misses_are_exposed(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(self.user).access_token}'}
+        self.assertEqual(self.client.get('/users/api/v1/users/', **auth)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/users/api/v1/users/', **auth)['X-Cache'], 'HIT')
+
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('social_app_response_cache_requests_total{view="UserListView",outcome="hits"} 1', body)
+        self.assertIn('social_app_response_cache_requests_total{view="UserListView",outcome="misses"} 1', body)
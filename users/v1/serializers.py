@@ -1,10 +1,11 @@
 import re
-import requests
 from rest_framework import serializers
 from django.core.validators import validate_email
 from django.contrib.auth import get_user_model, authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
 from users.validators import validate_email_format, validate_strong_password
+from users.authentication import tokens_for_user
+from users.oauth import GoogleAuthError, GoogleAuthUnavailable, fetch_google_userinfo
+from users.profile_pictures import ThumbnailURLField, thumbnail_urls
 
 
 User = get_user_model()
@@ -54,7 +55,7 @@ class LoginSerializer(serializers.Serializer):
         user = authenticate(email=email, password=password)
         if not user:
             raise serializers.ValidationError({"detail": "Invalid credentials."})
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -68,17 +69,14 @@ class GoogleAuthSerializer(serializers.Serializer):
     def validate(self, attrs):
         access_token = attrs.get("access_token")
         # Call Google UserInfo API
-        user_info_response = requests.get(
-            'https://www.googleapis.com/oauth2/v2/userinfo',
-            # 'https://openidconnect.googleapis.com/v1/userinfo',
-            headers={'Authorization': f'Bearer {access_token}'}
-        )
-
-        if user_info_response.status_code != 200:
+        try:
+            user_info = fetch_google_userinfo(access_token)
+        except GoogleAuthUnavailable:
+            # Not the client's fault, the view answers 503.
+            raise
+        except GoogleAuthError:
             raise serializers.ValidationError({"access_token": "Invalid Google access token."})
 
-        user_info = user_info_response.json()
-
         email = user_info.get("email")
         name = user_info.get("name")
 
@@ -88,7 +86,7 @@ class GoogleAuthSerializer(serializers.Serializer):
         # Get or create user
         user, created = User.objects.get_or_create(email=email, defaults={"name": name})
 
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
 
         return {
             "email": user.email,
@@ -101,10 +99,15 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
     """Serializer for updating user profile, email, and password."""
     password = serializers.CharField(write_only=True, required=False)
     email = serializers.EmailField(required=False)
+    profile_thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['name', 'bio', 'profile_picture', "location", "birth_date", 'email', 'password']
+        fields = ['name', 'bio', 'profile_picture', 'profile_thumbnails', "location", "birth_date", 'email',
+                  'password', 'friends_count', 'pending_received_count', 'pending_sent_count']
+
+    def get_profile_thumbnails(self, obj):
+        return thumbnail_urls(obj.profile_picture_hash) if obj.profile_picture_hash else None
 
     def validate_email(self, value):
         return validate_email_format(value)
@@ -113,25 +116,31 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
         return validate_strong_password(value)
 
     def update(self, instance, validated_data):
-        if 'email' in validated_data:
-            instance.email = validated_data['email']
+        changed = ['modified_on']
+        for field in ('email', 'name', 'bio', 'profile_picture', 'birth_date', 'location'):
+            if field in validated_data and validated_data[field] != getattr(instance, field):
+                setattr(instance, field, validated_data[field])
+                changed.append(field)
 
         if 'password' in validated_data:
             instance.set_password(validated_data['password'])
-
-        instance.name = validated_data.get('name', instance.name)
-        instance.bio = validated_data.get('bio', instance.bio)
-        instance.profile_picture = validated_data.get('profile_picture', instance.profile_picture)
-        instance.bio = validated_data.get('birth_date', instance.birth_date)
-        instance.bio = validated_data.get('location', instance.location)
-
-        instance.save()
+            # Revoke every token issued with the old password.
+            instance.token_version += 1
+            changed.extend(['password', 'token_version'])
+
+        # The friend counters are updated concurrently with F() expressions,
+        # a full save would overwrite them with the values loaded here. Only
+        # the changed fields are named so the user list stays cached when
+        # none of its fields changed.
+        instance.save(update_fields=changed)
         return instance
 
 
 class UserListSerializer(serializers.ModelSerializer):
     """Serializer for listing users (excluding self)."""
+    profile_thumbnail = ThumbnailURLField('small')
 
     class Meta:
         model = User
-        fields = ['id', 'name', 'email', 'bio', 'profile_picture', "location", "birth_date"]
+        fields = ['id', 'name', 'email', 'bio', 'profile_picture', 'profile_thumbnail', "location", "birth_date",
+                  'friends_count', 'pending_received_count', 'pending_sent_count']
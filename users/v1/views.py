@@ -3,14 +3,21 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
-from rest_framework.filters import SearchFilter
 
 from users.v1.serializers import (
     RegisterSerializer, LoginSerializer, GoogleAuthSerializer, 
     UserProfileUpdateSerializer, UserListSerializer)
+from core.utils.search import IndexedSearchFilter
 from core.utils.common import api_response, set_jwt_token_cookie, add_access_token_validity_cookie
-from core.utils.pagination import UserListPagination
+from core.utils.pagination import UserListCursorPagination, estimated_count
+from core.utils.serialization import FastListModelMixin
+from core.utils.conditional import ConditionalGetMixin, version_key
+from core.utils.response_cache import CachedResponseMixin
 from users.models import User
+from users.authentication import tokens_for_user
+from users.oauth import GoogleAuthUnavailable
+from users.jobs import upload_profile_picture
+from users.profile_pictures import InvalidProfilePicture, thumbnail_urls
 
 
 class RegisterView(generics.CreateAPIView):
@@ -79,7 +86,12 @@ class GoogleAuthView(APIView):
     def post(self, request):
         
         serializer = GoogleAuthSerializer(data=request.data)
-        if not serializer.is_valid():
+        try:
+            valid = serializer.is_valid()
+        except GoogleAuthUnavailable:
+            return api_response(False, "Google is unavailable, please retry.",
+                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if not valid:
             return api_response(
                 success=False,
                 message="Validation error.",
@@ -91,34 +103,80 @@ class GoogleAuthView(APIView):
         response = Response(status=status.HTTP_200_OK)
         set_jwt_token_cookie(
                     response,
-                    token,
+                    tokens,
                 )
         add_access_token_validity_cookie(response)
-        response.data = {'token': tokens['access'], user: tokens['email']}
+        response.data = {'token': tokens['access'], 'user': tokens['email']}
         return response
 
 
-class UserProfileView(APIView):
+class UserProfileView(ConditionalGetMixin, APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_version_keys(self, request):
+        return [version_key('user', request.user.id)]
+
+    def get_object(self):
+        # request.user is a cached snapshot, the profile needs the full row.
+        return User.objects.get(pk=self.request.user.id)
+
     def get(self, request):
-        serializer = UserProfileUpdateSerializer(request.user)
-        return api_response(True, "Profile fetched successfully.", serializer.data)
+        def get_response():
+            serializer = UserProfileUpdateSerializer(self.get_object())
+            return api_response(True, "Profile fetched successfully.", serializer.data)
+        return self.conditional_response(request, get_response)
 
     def patch(self, request):
-        serializer = UserProfileUpdateSerializer(request.user, data=request.data, partial=True)
+        serializer = UserProfileUpdateSerializer(self.get_object(), data=request.data, partial=True)
         if not serializer.is_valid():
             return api_response(False, "Validation error.", errors=serializer.errors, status_code=400)
-        serializer.save()
-        return api_response(True, "Profile updated successfully.", serializer.data)
-
+        password_changed = 'password' in serializer.validated_data
+        user = serializer.save()
+        if not password_changed:
+            return api_response(True, "Profile updated successfully.", serializer.data)
+
+        # The password change revoked every token, including the caller's.
+        refresh = tokens_for_user(user)
+        tokens = {'refresh': str(refresh), 'access': str(refresh.access_token), 'email': user.email}
+        response = api_response(True, "Profile updated successfully.",
+                                dict(serializer.data, token=tokens['access'], refresh=tokens['refresh']))
+        set_jwt_token_cookie(response, tokens)
+        add_access_token_validity_cookie(response)
+        return response
 
-class UserListView(ListAPIView):
+    def post(self, request):
+        """
+        Upload a profile picture as the multipart file `picture`. The
+        thumbnails are generated in the background, the profile switches to
+        the new picture once they are ready.
+        """
+        upload = request.FILES.get('picture')
+        if upload is None:
+            return api_response(False, "Picture file is required.", status_code=400)
+        try:
+            digest = upload_profile_picture(request.user.id, upload)
+        except InvalidProfilePicture as e:
+            return api_response(False, str(e), status_code=400)
+        return api_response(True, "Profile picture uploaded, thumbnails are being generated.",
+                            {'profile_thumbnails': thumbnail_urls(digest)}, status_code=202)
+
+
+class UserListView(ConditionalGetMixin, CachedResponseMixin, FastListModelMixin, ListAPIView):
     serializer_class = UserListSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = UserListPagination
-    filter_backends = [SearchFilter]
-    search_fields = ['name']
+    pagination_class = UserListCursorPagination
+    filter_backends = [IndexedSearchFilter]
+    search_fields = ['name', 'email', 'location']
+
+    def get_version_keys(self, request):
+        # Counter changes only bump the users involved, the counters in the
+        # list are refreshed when the short lived 'user-counters' expires.
+        return [version_key('users'), version_key('user-counters')]
 
     def get_queryset(self):
         return User.objects.exclude(id=self.request.user.id)
+
+    def get_estimated_count(self):
+        # Counted without excluding the user, so that every user shares the
+        # same count, answered by the planner on PostgreSQL.
+        return max(estimated_count(self.filter_queryset(User.objects.all())) - 1, 0)